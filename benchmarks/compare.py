@@ -0,0 +1,67 @@
+"""
+Compares two benchmark results, e.g. before and after a change.
+
+e.g.:
+    python -m benchmarks.compare antes.json depois.json
+"""
+import argparse
+import json
+import sys
+
+# Changes within this ratio are taken as noise
+NOISE = 0.05
+
+
+def load_cases(path: str) -> tuple[dict, dict]:
+    """
+    Loads a benchmarks.run result.
+
+    Args:
+        path (str): JSON path
+
+    Returns:
+        tuple[dict, dict]: Report and its cases, by (layout, rows)
+    """
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    return report, {(case['layout'], case['rows']): case for case in report['cases']}
+
+
+def compare(base_path: str, new_path: str) -> list[str]:
+    """
+    Lists the time and peak memory of every stage found in both results.
+
+    Args:
+        base_path (str): Result before the change
+        new_path (str): Result after the change
+
+    Returns:
+        list[str]: Report lines
+    """
+    base_report, base_cases = load_cases(base_path)
+    new_report, new_cases = load_cases(new_path)
+    lines = [f'{base_report.get("commit")} -> {new_report.get("commit")}']
+    for key in sorted(base_cases.keys() & new_cases.keys()):
+        base, new = base_cases[key], new_cases[key]
+        if 'error' in base or 'error' in new:
+            lines.append(f'{key[0]} {key[1]}: {base.get("error") or new.get("error")}')
+            continue
+        lines.append(f'{key[0]} {key[1]} linhas, pico de memória '
+                     f'{base["peak_memory_mb"] or 0:.0f} -> {new["peak_memory_mb"] or 0:.0f} MB')
+        for stage, timing in new['stages'].items():
+            if stage not in base['stages']:
+                continue
+            before, after = base['stages'][stage]['seconds'], timing['seconds']
+            ratio = after / before if before else 1.0
+            verdict = '' if abs(ratio - 1) <= NOISE else ('mais lento' if ratio > 1 else 'mais rápido')
+            lines.append(f'  {stage:<45} {before*1000:10.1f} -> {after*1000:10.1f} ms  x{ratio:.2f} {verdict}')
+    return lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compara dois resultados de benchmarks.run.')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    args = parser.parse_args()
+    print('\n'.join(compare(args.base, args.new)))
+    sys.exit(0)
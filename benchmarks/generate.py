@@ -0,0 +1,232 @@
+"""
+Seeded generator of synthetic statements, in every layout pre_process_csv
+reads. The same layout, rows and seed always give the same file.
+
+e.g.:
+    python -m benchmarks.generate --layout statement --rows 100000 extrato.csv
+"""
+import argparse
+import datetime
+import numpy as np
+import polars as pl
+
+LAYOUTS = ('finance', 'statement', 'card')
+# Statements span 1 to 10 years, at 20 transactions a day
+ROWS_PER_DAY = 20
+MIN_DAYS, MAX_DAYS = 365, 3650
+FIRST_DAY = datetime.date(2015, 1, 1)
+BANK = 'Banco Benchmark'
+# Counterparts are picked by a Zipf distribution, a few of them show up in
+# most transactions, just like real statements
+ZIPF_EXPONENT = 1.3
+PEOPLE = [f'Pessoa {idx}' for idx in range(2000)]
+MERCHANTS = [
+    'MERCADO BOM PRECO', 'FARMACIA SAO JOAO', 'POSTO SHELL', 'UBER *TRIP',
+    'IFOOD *RESTAURANTE', 'PADARIA PAO QUENTE', 'AMAZON MARKETPLACE',
+    'NETFLIX.COM', 'SPOTIFY', 'DROGARIA ARAUJO', 'ATACADAO', 'RAPPI *LOJA',
+    'LOJAS AMERICANAS', 'MAGAZINE LUIZA', 'CINEMARK', 'ESTACIONAMENTO CENTRO',
+    'ACADEMIA FORMA', 'LIVRARIA CULTURA', 'PET SHOP AMIGO', 'HORTIFRUTI'
+]
+COMPANIES = ['ENEL', 'SABESP', 'VIVO', 'CLARO', 'CONDOMINIO', 'IPVA', 'ESCOLA ABC', 'PLANO DE SAUDE']
+EMPLOYERS = ['EMPRESA XYZ LTDA', 'CONSULTORIA ABC SA']
+# (history, counterparts, category, sign, typical amount in R$, weight)
+TRANSACTION_KINDS = [
+    ('Pix enviado', PEOPLE, 'Pix', -1, 150.0, 30),
+    ('Pix recebido', PEOPLE, 'Pix', 1, 180.0, 20),
+    ('Compra no débito', MERCHANTS, 'Compra', -1, 80.0, 30),
+    ('Pagamento de boleto', COMPANIES, 'Boleto', -1, 300.0, 8),
+    ('Salário', EMPLOYERS, 'Salário', 1, 6000.0, 2),
+    ('Aplicação', ['CDB', 'LCI', 'TESOURO SELIC'], 'Aplicacao', -1, 1000.0, 4),
+    ('Resgate', ['CDB', 'LCI', 'TESOURO SELIC'], 'Investimento', 1, 1200.0, 3),
+    ('Tarifa', ['PACOTE DE SERVICOS', 'TED'], 'Tarifa', -1, 15.0, 3),
+]
+# Credit card bills only hold purchases, with a category of their own
+CARD_CATEGORIES = ['Supermercado', 'Farmácia', 'Transporte', 'Transporte', 'Restaurante',
+                   'Supermercado', 'Compras', 'Assinaturas', 'Assinaturas', 'Farmácia',
+                   'Supermercado', 'Restaurante', 'Compras', 'Compras', 'Lazer',
+                   'Transporte', 'Saúde', 'Educação', 'Compras', 'Supermercado']
+# One in this many card transactions is a refund
+CARD_REFUND_RATE = 50
+# Rules the benchmarks categorize with, so ingestion runs them too
+CATEGORY_RULES = [
+    {'match': 'prefix', 'pattern': 'Pix', 'category': 'Pix'},
+    {'match': 'keyword', 'pattern': 'uber', 'category': 'Transporte'},
+    {'match': 'keyword', 'pattern': 'posto', 'category': 'Transporte'},
+    {'match': 'regex', 'pattern': '^(IFOOD|RAPPI)', 'category': 'Alimentação'},
+    {'match': 'keyword', 'pattern': 'mercado', 'category': 'Supermercado'},
+]
+
+
+def brazilian_amount(cents: pl.Expr, prefix: str = '') -> pl.Expr:
+    """
+    Formats amounts in cents the brazilian way, e.g. -123456 -> -1.234,56.
+
+    Args:
+        cents (pl.Expr): Integer amounts, in cents
+        prefix (str, optional): Written between the sign and the number,
+            e.g. 'R$ '. Defaults to ''.
+
+    Returns:
+        pl.Expr: String expression
+    """
+    reais = cents.abs() // 100
+    # Thousands groups, most significant first, up to the billions
+    groups = [(reais // 1000**power % 1000).cast(pl.String) for power in range(3, -1, -1)]
+    integer = groups[-1]
+    for power in range(1, 4):
+        integer = pl.when(reais >= 1000**power).then(_join_groups(groups, power)).otherwise(integer)
+    return pl.concat_str(
+        pl.when(cents < 0).then(pl.lit('-')).otherwise(pl.lit('')),
+        pl.lit(prefix),
+        integer,
+        pl.lit(','),
+        (cents.abs() % 100).cast(pl.String).str.zfill(2))
+
+
+def _join_groups(groups: list[pl.Expr], power: int) -> pl.Expr:
+    """
+    Joins the thousands groups of numbers from 1000**power on, e.g. 1.234.567.
+
+    Args:
+        groups (list[pl.Expr]): Thousands groups, most significant first
+        power (int): How many groups follow the first one
+
+    Returns:
+        pl.Expr: String expression
+    """
+    first = len(groups) - power - 1
+    return pl.concat_str([groups[first]] + [group.str.zfill(3) for group in groups[first+1:]], separator='.')
+
+
+def transactions(rows: int, seed: int) -> pl.DataFrame:
+    """
+    Random transactions, sorted by date, as most banks export them.
+
+    Args:
+        rows (int): How many transactions
+        seed (int): Random seed
+
+    Returns:
+        pl.DataFrame: Data, Histórico, Descrição, Categoria, Centavos
+            (signed amount, in cents) and Rank (Zipf rank of the
+            counterpart) columns
+    """
+    rng = np.random.default_rng(seed)
+    days = min(max(rows // ROWS_PER_DAY, MIN_DAYS), MAX_DAYS)
+    weights = np.array([kind[5] for kind in TRANSACTION_KINDS], dtype=float)
+    kinds = rng.choice(len(TRANSACTION_KINDS), size=rows, p=weights / weights.sum())
+    # Zipf ranks, folded into each kind counterparts below
+    ranks = rng.zipf(ZIPF_EXPONENT, size=rows) - 1
+    scales = np.array([kind[4] for kind in TRANSACTION_KINDS])[kinds]
+    signs = np.array([kind[3] for kind in TRANSACTION_KINDS])[kinds]
+    cents = np.maximum(np.round(scales * rng.lognormal(0, 0.8, size=rows) * 100), 1).astype(np.int64) * signs
+    histories, counterparts, categories = [], [], []
+    for history, names, category, _, _, _ in TRANSACTION_KINDS:
+        histories.append(history)
+        counterparts.append(names)
+        categories.append(category)
+    names = np.empty(rows, dtype=object)
+    for idx, kind_names in enumerate(counterparts):
+        selected = kinds == idx
+        names[selected] = np.asarray(kind_names, dtype=object)[ranks[selected] % len(kind_names)]
+    return pl.DataFrame({
+        'Data': pl.Series(np.sort(rng.integers(0, days, size=rows)), dtype=pl.Int32),
+        'Histórico': pl.Series(histories).gather(kinds),
+        'Descrição': pl.Series(names, dtype=pl.String),
+        'Categoria': pl.Series(categories).gather(kinds),
+        'Centavos': cents,
+        'Rank': ranks
+    }).with_columns(pl.lit(FIRST_DAY).add(pl.duration(days=pl.col('Data'))).cast(pl.Date).alias('Data'))
+
+
+def write_finance(df: pl.DataFrame, path: str) -> None:
+    """
+    FinanceSchema layout, as saved by the app: ';' separated, ISO dates and
+    '.' as decimal separator.
+    """
+    df.select(
+        'Data',
+        pl.concat_str('Histórico', pl.lit(': '), 'Descrição').alias('Descrição'),
+        (pl.col('Centavos') / 100).alias('Valor'),
+        (pl.col('Centavos').cum_sum() / 100).alias('Saldo'),
+        'Categoria',
+        pl.lit(BANK).alias('Banco/Corretora'))\
+        .write_csv(path, separator=';', float_precision=2)
+
+
+def write_statement(df: pl.DataFrame, path: str) -> None:
+    """
+    "Extrato Conta Corrente" export: a header block, then ';' separated
+    rows with brazilian dates and amounts, and the running balance.
+    """
+    opening = 123456
+    first, last = df.get_column('Data').min(), df.get_column('Data').max()
+    header = ('Extrato Conta Corrente \n'
+              'Conta ;12345\n'
+              f'Período ;{first:%d/%m/%Y} a {last:%d/%m/%Y}\n'
+              f'Saldo ;{df.select(brazilian_amount(pl.lit(opening))).item()}\n'
+              '\n')
+    rows = df.select(
+        pl.col('Data').dt.strftime('%d/%m/%Y').alias('Data Lançamento'),
+        pl.concat_str('Histórico', pl.lit(' ')).alias('Histórico'),
+        'Descrição',
+        brazilian_amount(pl.col('Centavos')).alias('Valor'),
+        brazilian_amount(pl.col('Centavos').cum_sum() + opening).alias('Saldo'))
+    with open(path, 'wb') as f:
+        f.write(header.encode('utf-8'))
+        rows.write_csv(f, separator=';')
+
+
+def write_card(df: pl.DataFrame, path: str) -> None:
+    """
+    Credit card bill: ',' separated and quoted, with 'Tipo' and 'Lançamento'
+    columns, and amounts such as "R$ 1.234,56". Purchases are positive.
+    """
+    purchases = df.with_row_index('Linha')
+    merchant = purchases.get_column('Rank') % len(MERCHANTS)
+    purchases.select(
+        pl.col('Data').dt.strftime('%d/%m/%Y'),
+        pl.Series(MERCHANTS).gather(merchant).alias('Lançamento'),
+        pl.Series(CARD_CATEGORIES).gather(merchant).alias('Categoria'),
+        pl.when(pl.col('Linha') % 7 == 0).then(pl.lit('Parcela 1/3')).otherwise(pl.lit('Compra à vista')).alias('Tipo'),
+        brazilian_amount(
+            pl.when(pl.col('Linha') % CARD_REFUND_RATE == 0)
+            .then(-pl.col('Centavos').abs())
+            .otherwise(pl.col('Centavos').abs()),
+            prefix='R$ ').alias('Valor'))\
+        .write_csv(path, separator=',', quote_style='always')
+
+
+def generate_statement(layout: str, rows: int, path: str, seed: int = 0) -> None:
+    """
+    Writes a synthetic statement.
+
+    Args:
+        layout (str): 'finance', 'statement' or 'card'
+        rows (int): How many transactions
+        path (str): CSV path
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Raises:
+        ValueError: Unknown layout
+    """
+    df = transactions(rows, seed)
+    match layout:
+        case 'finance':
+            write_finance(df, path)
+        case 'statement':
+            write_statement(df, path)
+        case 'card':
+            write_card(df, path)
+        case _:
+            raise ValueError(f'Layout desconhecido: {layout}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera extratos sintéticos para os benchmarks.')
+    parser.add_argument('--layout', choices=LAYOUTS, default='finance')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('path')
+    args = parser.parse_args()
+    generate_statement(args.layout, args.rows, args.path, args.seed)
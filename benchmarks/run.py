@@ -0,0 +1,303 @@
+"""
+Benchmarks of the data pipeline, from statement ingestion to the dashboard
+HTML. Every (layout, rows) case runs in its own process, so its peak memory
+is its own. Results are written as JSON, see benchmarks/compare.py.
+
+e.g.:
+    python -m benchmarks.run --sizes 1k 100k 1M --output antes.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import polars as pl
+from benchmarks.generate import LAYOUTS, BANK, CATEGORY_RULES, generate_statement
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+# Generated statements are kept here and reused, they only depend on the seed
+DATA_DIR = os.path.join(BENCHMARKS_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+SIZE_UNITS = {'k': 1_000, 'M': 1_000_000}
+# 1k to 10M rows, 10M is left out by default since it takes a while
+SIZES = ('1k', '10k', '100k', '1M', '10M')
+DEFAULT_SIZES = ('1k', '10k', '100k', '1M')
+REFRESH_SCHEDULES = ('daily', 'weekly', 'monthly', 'quarterly', 'yearly')
+# Dashboard drawn as on a full HD screen, see points_for_width
+CHART_WIDTH = 1920
+CHART_GRID = (3, 4)
+
+
+def parse_size(size: str) -> int:
+    """
+    Parses sizes such as 1k, 100k, 1M or 1500.
+
+    Args:
+        size (str): Size
+
+    Returns:
+        int: Rows
+    """
+    if size[-1] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size)
+
+
+def peak_memory_mb() -> float | None:
+    """
+    Peak resident memory of this process so far.
+
+    Returns:
+        float | None: Megabytes, None when it cannot be measured
+    """
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_memory_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _windows_peak_memory_mb() -> float | None:
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize / 1024**2
+    except (AttributeError, OSError):
+        return None
+
+
+def statement_path(layout: str, rows: int, seed: int) -> str:
+    """
+    Generates a statement, unless it was already generated.
+
+    Args:
+        layout (str): 'finance', 'statement' or 'card'
+        rows (int): How many transactions
+        seed (int): Random seed
+
+    Returns:
+        str: CSV path
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f'{layout}_{rows}_{seed}.csv')
+    if not os.path.exists(path):
+        generate_statement(layout, rows, path, seed)
+    return path
+
+
+class CaseTimer():
+    def __init__(self, rows: int, repeat: int) -> None:
+        """
+        Times the stages of a benchmark case, keeping the best of repeat
+        runs, along with the throughput and the peak memory right after it.
+
+        Args:
+            rows (int): Rows of the case, for the throughput
+            repeat (int): Runs of each stage
+        """
+        self.rows = rows
+        self.repeat = repeat
+        self.stages = {}
+
+
+    def measure(self, stage: str, run, setup=None):
+        """
+        Runs a stage.
+
+        Args:
+            stage (str): Stage name
+            run (Callable): Stage itself
+            setup (Callable, optional): Runs, untimed, before each run, e.g.
+                to drop cached results. Defaults to None.
+
+        Returns:
+            Any: What the last run returned
+        """
+        best = None
+        result = None
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            result = None
+            start = time.perf_counter()
+            result = run()
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        self.stages[stage] = {
+            'seconds': round(best, 6),
+            'rows_per_second': round(self.rows / best) if best else None,
+            'peak_memory_mb': peak_memory_mb()
+        }
+        print(f'  {stage:<45} {best*1000:10.1f} ms', file=sys.stderr)
+        return result
+
+
+def run_case(layout: str, rows: int, path: str, refresh: str, repeat: int) -> dict:
+    """
+    Runs every stage of a case: ingestion, ledger load and recalculation,
+    every query, figure build and serialization.
+
+    Args:
+        layout (str): 'finance', 'statement' or 'card'
+        rows (int): How many transactions
+        path (str): Statement path
+        refresh (str): Period of the period queries
+        repeat (int): Runs of each stage
+
+    Returns:
+        dict: Case results
+    """
+    # Imported here, so their import time is not part of the parent
+    from preprocess_lib.csv import pre_process_csv
+    from models.ledger import Ledger
+    from models.rollup import PeriodRollup
+    from chart_lib.generate_chart import ChartBuilder
+    from chart_lib.downsample import points_for_width
+    # The app modules are found through the working directory, so it only
+    # changes once they are imported. The benchmark rules are found there.
+    os.chdir(DATA_DIR)
+
+    timer = CaseTimer(rows, repeat)
+    memory_before = peak_memory_mb()
+    timer.measure('ingest', lambda: pre_process_csv(path, bank=BANK))
+    ledger = timer.measure('load', lambda: Ledger(path, BANK))
+    ledger.detach_journal()
+    timer.measure('recalculate', ledger.recalculate_data)
+
+    def cold_queries():
+        # Every query starts from scratch, rollups included
+        ledger.rollup = PeriodRollup()
+        ledger.query_cache.clear()
+
+    queries = {
+        f'get_transactions_by({refresh})': lambda: ledger.get_transactions_by(refresh),
+        'get_top_significant_expenses_by_category': ledger.get_top_significant_expenses_by_category,
+        'get_distribution_by_bank': ledger.get_distribution_by_bank,
+        f'get_total_amount_by({refresh})': lambda: ledger.get_total_amount_by(refresh)
+    }
+    for stage, query in queries.items():
+        timer.measure(stage, query, setup=cold_queries)
+    dashboard = timer.measure(f'get_dashboard({refresh})', lambda: ledger.get_dashboard(refresh),
+                              setup=cold_queries)
+
+    def build_figure():
+        chart_model = ChartBuilder(grid=CHART_GRID, refresh=refresh)
+        chart_model.set_point_budget(points_for_width(CHART_WIDTH))
+        chart_model.refresh_plots(**dashboard)
+        return chart_model.get_figure()
+
+    fig = timer.measure('figure', build_figure)
+    figure_json = timer.measure('to_json', fig.to_json)
+    figure_html = timer.measure('to_html', fig.to_html)
+    return {
+        'layout': layout,
+        'rows': rows,
+        'file_mb': round(os.path.getsize(path) / 1024**2, 3),
+        'ledger_rows': ledger.data.height,
+        'json_mb': round(len(figure_json) / 1024**2, 3),
+        'html_mb': round(len(figure_html) / 1024**2, 3),
+        'baseline_memory_mb': memory_before,
+        'peak_memory_mb': peak_memory_mb(),
+        'stages': timer.stages
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_isolated(args: argparse.Namespace, layout: str, rows: int, path: str) -> dict:
+    """
+    Runs a case in a new process, the app prints a lot to stdout, so the
+    results come back through a file.
+
+    Returns:
+        dict: Case results, or the error
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'case.json')
+        command = [sys.executable, '-m', 'benchmarks.run',
+                   '--case', layout, str(rows), path, output,
+                   '--refresh', args.refresh, '--repeat', str(args.repeat)]
+        completed = subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+        if completed.returncode or not os.path.exists(output):
+            return {'layout': layout, 'rows': rows, 'error': f'saída {completed.returncode}'}
+        with open(output, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks do PFO, de extratos ao HTML do dashboard.')
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument('--sizes', nargs='+', default=list(DEFAULT_SIZES),
+                        help=f'Linhas por extrato, e.g. {" ".join(SIZES)}')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='Execuções de cada etapa, vale a melhor')
+    parser.add_argument('--refresh', choices=REFRESH_SCHEDULES, default='daily')
+    parser.add_argument('--output', help='JSON de saída. Padrão: benchmarks/results/<commit>.json')
+    # Internal, a single case: layout, rows, statement path and output path
+    parser.add_argument('--case', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        layout, rows, path, output = args.case
+        result = run_case(layout, int(rows), path, args.refresh, args.repeat)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(os.path.join(DATA_DIR, 'category_rules.json'), 'w', encoding='utf-8') as f:
+        json.dump(CATEGORY_RULES, f, ensure_ascii=False, indent=2)
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'refresh': args.refresh,
+        'python': platform.python_version(),
+        'polars': pl.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'cases': []
+    }
+    for layout in args.layouts:
+        for size in args.sizes:
+            rows = parse_size(size)
+            print(f'{layout} {rows} linhas', file=sys.stderr)
+            path = statement_path(layout, rows, args.seed)
+            report['cases'].append(run_isolated(args, layout, rows, path))
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit or "local"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(output)
+    return 0 if all('error' not in case for case in report['cases']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
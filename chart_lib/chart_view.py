@@ -0,0 +1,144 @@
+import os
+import json
+from importlib.util import find_spec
+from PyQt6.QtCore import QObject, QUrl, pyqtSignal, pyqtSlot
+from PyQt6.QtWebChannel import QWebChannel
+from PyQt6.QtWebEngineWidgets import QWebEngineView
+
+# plotly.js bundled with the plotly package, so charts work offline. Found
+# without importing plotly, the view is created before plotly is needed.
+PLOTLYJS_DIR = os.path.join(find_spec('plotly').submodule_search_locations[0], 'package_data')
+
+# Loaded once, later refreshes only push the figure JSON into Plotly.react
+CHART_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="plotly.min.js"></script>
+<script src="qrc:///qtwebchannel/qwebchannel.js"></script>
+<style>
+html, body, #chart { margin: 0; width: 100%; height: 100%; background: #111111; }
+#loading { position: absolute; top: 50%; width: 100%; text-align: center; color: #aaaaaa; font-family: sans-serif; }
+</style>
+</head>
+<body>
+<div id="loading">Carregando gráficos...</div>
+<div id="chart"></div>
+<script>
+new QWebChannel(qt.webChannelTransport, function(channel) {
+    window.bridge = channel.objects.bridge;
+});
+function renderFigure(figure) {
+    var loading = document.getElementById('loading');
+    if (loading) loading.remove();
+    Plotly.react('chart', figure.data, figure.layout, {responsive: true}).then(function(gd) {
+        if (!gd.relayoutBridged) {
+            gd.on('plotly_relayout', function(event) {
+                if (window.bridge) window.bridge.relayout(JSON.stringify(event));
+            });
+            gd.relayoutBridged = true;
+        }
+    });
+}
+function restyleTrace(uid, update) {
+    var gd = document.getElementById('chart');
+    var idx = gd.data.findIndex(function(trace) { return trace.uid === uid; });
+    if (idx >= 0) Plotly.restyle(gd, update, [idx]);
+}
+</script>
+</body>
+</html>
+"""
+
+
+class ChartBridge(QObject):
+    # Visible (start, end) dates, or None when zoomed back out
+    xRangeChanged = pyqtSignal(object)
+
+    @pyqtSlot(str)
+    def relayout(self, event_json: str) -> None:
+        """
+        Receives plotly_relayout events from the chart page.
+
+        Args:
+            event_json (str): Relayout event, in JSON
+        """
+        event = json.loads(event_json)
+        if event.get('xaxis.autorange'):
+            self.xRangeChanged.emit(None)
+        elif 'xaxis.range[0]' in event:
+            self.xRangeChanged.emit((event['xaxis.range[0]'], event['xaxis.range[1]']))
+        elif 'xaxis.range' in event:
+            self.xRangeChanged.emit(tuple(event['xaxis.range']))
+
+
+class ChartView(QWebEngineView):
+    def __init__(self, parent=None) -> None:
+        """
+        Web view which loads the chart page a single time. Figures are then
+        rendered by Plotly.react, which only updates what changed instead
+        of reloading the page. The page starts loading, with the local
+        plotly.js, as soon as the view is created, so create it early.
+
+        Args:
+            parent (QWidget, optional): Parent widget. Defaults to None.
+        """
+        super().__init__(parent)
+        self._ready = False
+        self._pending_json = None
+        self.loadFinished.connect(self._page_loaded)
+        # Zoom events come back from the page through a web channel
+        self.bridge = ChartBridge(self)
+        self.xRangeChanged = self.bridge.xRangeChanged
+        self._channel = QWebChannel(self.page())
+        self._channel.registerObject('bridge', self.bridge)
+        self.page().setWebChannel(self._channel)
+        self.setHtml(CHART_PAGE, QUrl.fromLocalFile(PLOTLYJS_DIR + os.sep))
+
+
+    def show_figure(self, fig) -> None:
+        """
+        Renders a figure on the chart page.
+
+        Args:
+            fig (go.Figure): Figure to be rendered
+        """
+        self.show_json(fig.to_json())
+
+
+    def show_json(self, figure_json: str) -> None:
+        """
+        Renders a figure already serialized. While the page is still loading
+        only the newest figure is kept, and it is rendered once it is ready.
+
+        Args:
+            figure_json (str): Figure JSON, as given by go.Figure.to_json()
+        """
+        if not self._ready:
+            self._pending_json = figure_json
+            return
+        self.page().runJavaScript(f'renderFigure({figure_json});')
+
+
+    def restyle_trace(self, uid: str, update: dict) -> None:
+        """
+        Replaces attributes of a single trace, e.g. its points, without
+        rendering the whole figure again.
+
+        Args:
+            uid (str): Trace uid
+            update (dict): Attributes to be replaced, e.g. x, y and text
+        """
+        if not self._ready:
+            return
+        # Loads plotly's serializers, only needed once the user zooms
+        from plotly.io.json import to_json_plotly
+        update = to_json_plotly({key: [value] for key, value in update.items()})
+        self.page().runJavaScript(f'restyleTrace({json.dumps(uid)}, {update});')
+
+
+    def _page_loaded(self, ok: bool) -> None:
+        self._ready = ok
+        if ok and self._pending_json is not None:
+            figure_json, self._pending_json = self._pending_json, None
+            self.show_json(figure_json)
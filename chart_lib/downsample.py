@@ -0,0 +1,61 @@
+import numpy as np
+
+# Horizontal pixels per plotted point when sizing the point budget
+PIXELS_PER_POINT = 4
+# Below this many points downsampling is not worth it
+MIN_POINTS = 100
+
+
+def points_for_width(width: int, pixels_per_point: int = PIXELS_PER_POINT) -> int:
+    """
+    Point budget for a chart drawn across width pixels.
+
+    Args:
+        width (int): Chart width, in pixels
+        pixels_per_point (int, optional): Pixels per point. Defaults to PIXELS_PER_POINT.
+
+    Returns:
+        int: Max points to be drawn
+    """
+    return max(MIN_POINTS, width // pixels_per_point)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Keeps the first and last
+    points, then from each bucket the point forming the largest triangle
+    with the previously kept point and the average of the next bucket, so
+    peaks and valleys survive.
+
+    Args:
+        x (np.ndarray): Sorted x values, numbers or datetime64
+        y (np.ndarray): y values
+        threshold (int): Max points to be kept
+
+    Returns:
+        np.ndarray: Indexes of the kept points, sorted
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[s]').astype(np.int64)
+    x = x.astype(float)
+    y = y.astype(float)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    # threshold-2 buckets between the first and last points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket == threshold - 3:
+            next_x, next_y = x[n - 1], y[n - 1]
+        else:
+            next_x = x[end:edges[bucket + 2]].mean()
+            next_y = y[end:edges[bucket + 2]].mean()
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[bucket + 1] = a
+    return kept
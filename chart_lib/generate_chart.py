@@ -2,7 +2,9 @@ from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 import datetime
 import random
+import numpy as np
 from .functions import populate_grid_specs, generate_grid_specs, p_obj
+from .downsample import lttb
 
 class ChartBuilder():
     def __init__(self,
@@ -14,7 +16,11 @@ class ChartBuilder():
         self.dict_markers = {}
         self.marker_scatter = {'color':f"rgb({random.randrange(0, 255)}, {random.randrange(0, 255)}, {random.randrange(0, 255)})"}
         self.current_grid = grid
-        self.set_figure()
+        # Max points drawn on the balance scatter, None draws all of them
+        self.point_budget = None
+        self.scatter_values = (np.array([]), np.array([]))
+        # Built by refresh_plots, the first plotly figure is expensive
+        self.fig = None
         self.set_schedule(refresh)
 
 
@@ -36,11 +42,35 @@ class ChartBuilder():
                 self.refresh_schedule_tuple = ('Dia', 'diário')
 
 
+    def set_point_budget(self, points):
+        self.point_budget = points
+
+
+    def copy(self) -> 'ChartBuilder':
+        """
+        New builder with the same grid, schedule and colors, e.g. for a
+        background refresh while this one still backs the figure on screen.
+
+        Returns:
+            ChartBuilder: Builder sharing no state with this one
+        """
+        builder = ChartBuilder(grid=self.current_grid)
+        builder.refresh_schedule_tuple = self.refresh_schedule_tuple
+        builder.dict_colors = dict(self.dict_colors)
+        builder.dict_bank_colors = dict(self.dict_bank_colors)
+        builder.dict_markers = dict(self.dict_markers)
+        builder.marker_scatter = dict(self.marker_scatter)
+        builder.point_budget = self.point_budget
+        return builder
+
+
     def set_figure(self):
         self.fig = go.Figure()
 
 
     def get_figure(self):
+        if self.fig is None:
+            self.set_figure()
         return self.fig
 
 
@@ -87,39 +117,39 @@ class ChartBuilder():
         #     '<b>Categorias mais usadas</b>'
         # ]
 
-        repeated_marker = []
+        # O(1) lookups for legend rank
+        rank = {cat: idx for idx, cat in enumerate(rank_cat['Categoria'])}
+        # Row indexes by category, so each category is a single trace
+        rows_by_cat = {}
+        for idx, cat in enumerate(category):
+            rows_by_cat.setdefault(cat, []).append(idx)
+        X, Y, description = np.asarray(X), np.asarray(Y, dtype=float), np.asarray(description, dtype=object)
+        sign = np.where(Y >= 0, '+', '-')
 
         invest = []
         invest_type = []
-        for idx, cat in enumerate(category):
-            # if not self.dict_markers.get(cat):
+        for cat, rows in rows_by_cat.items():
             if not self.dict_colors.get(cat):
                 self.dict_colors[cat] = f"rgb({random.randrange(0, 255)}, {random.randrange(0, 255)}, {random.randrange(0, 255)})"
-            marker = {'color':self.dict_colors.get(cat)}
-            if cat in repeated_marker:
-                pick_legend = False # needs always
-            else:
-                repeated_marker.append(cat)
-                pick_legend = True # needs always
             self.fig.add_trace(
                 go.Bar(
-                    x=[X[idx]],
-                    y=[Y[idx]],
+                    x=X[rows],
+                    y=Y[rows],
                     name=cat,
-                    marker=marker,
-                    showlegend=pick_legend,
+                    marker={'color':self.dict_colors.get(cat)},
                     legendgroup=cat,
-                    text=f'+ R$ {abs(Y[idx]):.2f}' if Y[idx] >= 0 else f'- R$ {abs(Y[idx]):.2f}',
+                    text=sign[rows],
                     textposition='none',
-                    hoverinfo='name+text',
-                    legendrank=rank_cat['Categoria'].index(cat)+2
+                    customdata=np.abs(Y[rows]),
+                    hovertemplate='%{text} R$ %{customdata:.2f}<extra>%{fullData.name}</extra>',
+                    legendrank=rank[cat]+2
                     ),
                     row=obj_grid['transactions'][0],
                     col=obj_grid['transactions'][1]
             )
             if cat == 'Aplicacao':
-                invest.append(abs(Y[idx]))
-                invest_type.append(description[idx])
+                invest = np.abs(Y[rows])
+                invest_type = description[rows]
         # Pie
         self.fig.add_trace(
                 go.Pie(
@@ -131,6 +161,10 @@ class ChartBuilder():
                 row=obj_grid['investment'][0],
                 col=obj_grid['investment'][1]
             )
+        # Banks imported without a color set (e.g. headless reports) get one
+        for bank in rank_bank['Banco/Corretora']:
+            if not self.dict_bank_colors.get(bank):
+                self.dict_bank_colors[bank] = f"rgb({random.randrange(0, 255)}, {random.randrange(0, 255)}, {random.randrange(0, 255)})"
         print(self.dict_bank_colors)
         # Treemap bank
         self.fig.add_trace(
@@ -178,10 +212,14 @@ class ChartBuilder():
 
 
     def create_scatterplot(self, X, Y):
+        # Full resolution is kept, to be drawn again when zooming in
+        self.scatter_values = (np.asarray(X), np.asarray(Y, dtype=float))
+        window = self.scatter_window()
         scatter_obj = go.Scatter(
-                x=X,
-                y=Y,
-                text=[f'R$ {value:.2f}' for value in Y],
+                x=window['x'],
+                y=window['y'],
+                text=window['text'],
+                uid='saldo',
                 textposition='top center',
                 mode='lines+markers+text',
                 name=f'Saldo {self.refresh_schedule_tuple[1]}',
@@ -193,6 +231,36 @@ class ChartBuilder():
         self.fig.add_trace(scatter_obj)
 
 
+    def scatter_window(self, x_range=None, point_budget=None) -> dict:
+        """
+        Downsamples the balance scatter to the point budget, with LTTB,
+        labelling only the points kept.
+
+        Args:
+            x_range (tuple, optional): (start, end) of the visible dates.
+                Defaults to None, the whole series.
+            point_budget (int, optional): Max points drawn. Defaults to None,
+                the builder's point budget.
+
+        Returns:
+            dict: x, y and text of the points to be drawn
+        """
+        X, Y = self.scatter_values
+        if x_range is not None and len(X):
+            start, end = (np.datetime64(str(bound).replace(' ', 'T')) for bound in x_range)
+            visible = (X >= start) & (X <= end)
+            X, Y = X[visible], Y[visible]
+        point_budget = point_budget or self.point_budget
+        if point_budget:
+            kept = lttb(X, Y, point_budget)
+            X, Y = X[kept], Y[kept]
+        return {
+            'x': X,
+            'y': Y,
+            'text': [f'R$ {value:.2f}' for value in Y]
+        }
+
+
         # range_dates = [X[0]+datetime.timedelta(days=day) for day in range((X[-1]-X[0]).days)]
         # excluded_dates = list(set(range_dates).difference(X))
         # print(excluded_dates, range_dates)
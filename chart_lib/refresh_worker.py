@@ -0,0 +1,65 @@
+from typing import Callable
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+from models.dashboard import DashboardSnapshot
+from .generate_chart import ChartBuilder
+
+
+class ChartRefreshSignals(QObject):
+    # generation, figure JSON, builder holding the figure
+    finished = pyqtSignal(int, str, object)
+    # generation, error message
+    failed = pyqtSignal(int, str)
+
+
+class ChartRefreshWorker(QRunnable):
+    def __init__(self,
+                 generation: int,
+                 is_current: Callable[[int], bool],
+                 snapshot: DashboardSnapshot,
+                 chart_model: ChartBuilder,
+                 refresh_schedule: str,
+                 point_budget: int) -> None:
+        """
+        Runs the dashboard queries, builds the figure and serializes it, off
+        the GUI thread. The result is posted back through `signals`, which
+        Qt delivers on the thread the receiver lives in.
+        The worker owns chart_model, the GUI thread only gets it back along
+        with the figure, so zooming never reads a half built one.
+        A newer refresh makes this one stale, it then stops at the next step
+        instead of finishing work nobody will see.
+
+        Args:
+            generation (int): Refresh number
+            is_current (Callable[[int], bool]): Tells whether a generation is still the latest
+            snapshot (DashboardSnapshot): Dashboard queries at one data version
+            chart_model (ChartBuilder): Builds the figure, not used by anyone else
+            refresh_schedule (str): daily, weekly, monthly, quarterly or yearly
+            point_budget (int): Max points drawn on the balance scatter
+        """
+        super().__init__()
+        self.generation = generation
+        self.is_current = is_current
+        self.snapshot = snapshot
+        self.chart_model = chart_model
+        self.refresh_schedule = refresh_schedule
+        self.point_budget = point_budget
+        self.signals = ChartRefreshSignals()
+
+
+    def run(self):
+        try:
+            if not self.is_current(self.generation):
+                return
+            dashboard = self.snapshot.collect()
+            if not self.is_current(self.generation):
+                return
+            self.chart_model.set_schedule(self.refresh_schedule)
+            self.chart_model.set_point_budget(self.point_budget)
+            self.chart_model.refresh_plots(**dashboard)
+            if not self.is_current(self.generation):
+                return
+            figure_json = self.chart_model.get_figure().to_json()
+        except Exception as e:
+            self.signals.failed.emit(self.generation, str(e))
+            return
+        self.signals.finished.emit(self.generation, figure_json, self.chart_model)
@@ -2,7 +2,6 @@ import sys
 from PyQt6 import QtCore, QtGui
 from PyQt6.QtWidgets import (QDialogButtonBox, QLabel, QDateEdit, QLineEdit, QButtonGroup, QGridLayout,
                              QDoubleSpinBox, QRadioButton, QDialog, QWidget, QVBoxLayout)
-from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtCore import Qt, QSize
 
 class AddNewRegistry(QDialog):
@@ -0,0 +1,100 @@
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+# Query results kept by default, least recently used ones are evicted first
+QUERY_CACHE_SIZE = 32
+
+
+class QueryCache():
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE) -> None:
+        """
+        Bounded LRU cache for query results, with hit/miss counters.
+
+        Args:
+            maxsize (int, optional): Max results kept. Defaults to QUERY_CACHE_SIZE.
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Chart refreshes read and fill the cache from a worker thread
+        self._lock = threading.Lock()
+
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """
+        Looks a result up, marking it as recently used.
+
+        Args:
+            key (Hashable): Result key
+
+        Returns:
+            tuple[bool, Any]: Whether it was found, and the result itself
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores a result, evicting the least recently used one when full.
+
+        Args:
+            key (Hashable): Result key
+            value (Any): Result
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+    def info(self) -> dict:
+        """
+        Cache statistics.
+
+        Returns:
+            dict: hits, misses, current size and maxsize
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize
+        }
+
+
+def versioned_query(method: Callable) -> Callable:
+    """
+    Caches a query method by the object data version plus the query
+    arguments. The object must have `data_version` and `query_cache`.
+    Results from older versions are never hit again and age out of the LRU.
+
+    Args:
+        method (Callable): Query method
+
+    Returns:
+        Callable: Cached query method
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, self.data_version, args, tuple(sorted(kwargs.items())))
+        found, result = self.query_cache.get(key)
+        if not found:
+            result = method(self, *args, **kwargs)
+            self.query_cache.put(key, result)
+        return result
+    return wrapper
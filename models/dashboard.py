@@ -0,0 +1,48 @@
+import polars as pl
+from typing import Hashable
+from models.cache import QueryCache
+
+
+class DashboardSnapshot():
+    def __init__(self,
+                 key: Hashable,
+                 cache: QueryCache,
+                 plans: list[pl.LazyFrame] | None = None,
+                 result: dict | None = None) -> None:
+        """
+        Dashboard queries frozen at one data version. The plans only reference
+        frames which are never changed in place (the model rebinds its frames
+        on every change), so the snapshot can be collected from any thread
+        while the model keeps changing.
+
+        Args:
+            key (Hashable): Query cache key, bound to the data version
+            cache (QueryCache): Cache the result is stored into
+            plans (list[pl.LazyFrame] | None, optional): bar, categories, bank
+                and balance plans. Defaults to None.
+            result (dict | None, optional): Result already cached. Defaults to None.
+        """
+        self.key = key
+        self.cache = cache
+        self.plans = plans
+        self.result = result
+
+
+    def collect(self) -> dict:
+        """
+        Runs every plan at once with pl.collect_all, so the ledger scans are
+        shared between them, and caches the result.
+
+        Returns:
+            dict: ChartBuilder.refresh_plots keyword arguments
+        """
+        if self.result is None:
+            bar_values, rank_categories, rank_bank, scatter_values = pl.collect_all(self.plans)
+            self.result = {
+                'bar_values': bar_values.to_dict(),
+                'rank_categories': rank_categories.to_dict(as_series=False),
+                'rank_bank': rank_bank.to_dict(as_series=False),
+                'scatter_values': scatter_values.to_dict()
+            }
+            self.cache.put(self.key, self.result)
+        return self.result
@@ -0,0 +1,118 @@
+import polars as pl
+
+# Columns which identify a transaction within the ledger
+DUPLICATE_KEY = ('Data', 'Descrição', 'Valor', 'Banco/Corretora')
+# Fixed seed, so the same row always hashes the same way
+HASH_SEED = 0
+
+
+def row_hash() -> pl.Expr:
+    """
+    Hash of the DUPLICATE_KEY columns of each row.
+
+    Returns:
+        pl.Expr: UInt64 hash
+    """
+    return pl.struct(DUPLICATE_KEY).hash(seed=HASH_SEED).alias('Hash')
+
+
+class DuplicateIndex():
+    def __init__(self) -> None:
+        """
+        Occurrence counts of every transaction in the ledger, by row hash.
+        Statements exported from the same bank overlap, so imported rows are
+        checked against these counts before going into the ledger, in time
+        proportional to the import only.
+        The counts are built from the ledger by build, on startup, or else on
+        the first check, and kept up to date from then on.
+        """
+        # Row hash -> how many ledger rows have it, None until first needed
+        self._counts = None
+
+
+    def _hash_counts(self, rows: pl.DataFrame) -> list[tuple[int, int]]:
+        """
+        Counts rows by hash.
+
+        Args:
+            rows (pl.DataFrame): Ledger rows
+
+        Returns:
+            list[tuple[int, int]]: (hash, count) pairs
+        """
+        return rows.group_by(row_hash()).len().rows()
+
+
+    def build(self, data: pl.DataFrame) -> None:
+        """
+        Counts the ledger rows, unless they were counted already.
+
+        Args:
+            data (pl.DataFrame): Current ledger
+        """
+        if self._counts is None:
+            self._counts = dict(self._hash_counts(data))
+
+
+    def add(self, rows: pl.DataFrame) -> None:
+        """
+        Counts rows inserted into the ledger.
+
+        Args:
+            rows (pl.DataFrame): Inserted rows
+        """
+        if self._counts is None or rows.is_empty():
+            return
+        for key, count in self._hash_counts(rows):
+            self._counts[key] = self._counts.get(key, 0) + count
+
+
+    def remove(self, rows: pl.DataFrame) -> None:
+        """
+        Uncounts rows removed from the ledger.
+
+        Args:
+            rows (pl.DataFrame): Removed rows
+        """
+        if self._counts is None or rows.is_empty():
+            return
+        for key, count in self._hash_counts(rows):
+            self._counts[key] -= count
+            if not self._counts[key]:
+                del self._counts[key]
+
+
+    def new_rows(self,
+                 statement: pl.DataFrame,
+                 data: pl.DataFrame,
+                 accepted: dict | None = None) -> pl.DataFrame:
+        """
+        Drops the rows of an incoming statement which are already in the
+        ledger. A transaction found n times in the statement and k times in
+        the ledger is kept n-k times, so identical purchases made on the same
+        day are not lost.
+
+        Args:
+            statement (pl.DataFrame): Rows of one imported statement
+            data (pl.DataFrame): Current ledger, read only to build the counts
+            accepted (dict | None, optional): Counts of the rows accepted from
+                statements imported along with this one, which are treated as
+                part of the ledger. Updated with the rows kept. Defaults to None.
+
+        Returns:
+            pl.DataFrame: Rows not in the ledger yet
+        """
+        self.build(data)
+        if statement.is_empty():
+            return statement
+        hashed = statement.with_columns(row_hash())
+        keys = hashed.get_column('Hash').unique()
+        accepted = accepted if accepted is not None else {}
+        known = pl.Series([self._counts.get(key, 0) + accepted.get(key, 0) for key in keys.to_list()],
+                          dtype=pl.Int64)
+        kept = hashed.filter(
+            pl.int_range(pl.len()).over('Hash') >= pl.col('Hash').replace_strict(
+                keys, known, default=0, return_dtype=pl.Int64))
+        for key, count in kept.group_by('Hash').len().rows():
+            accepted[key] = accepted.get(key, 0) + count
+        return kept.drop('Hash')
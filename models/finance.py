@@ -1,19 +1,26 @@
 import polars as pl
-import datetime
-from polars import DataFrame
 from PyQt6 import QtCore
-from PyQt6.QtCore import Qt, QSize, QModelIndex
-from schema.finance import FinanceSchema
-from preprocess_lib.csv import pre_process_csv
+from PyQt6.QtCore import Qt, QSize, QModelIndex, pyqtSignal
+from models.ledger import Ledger, LedgerListener
 
 
-class FinanceModel(QtCore.QAbstractTableModel):
+class FinanceModel(QtCore.QAbstractTableModel, LedgerListener):
+    # Emitted when the change journal should be folded into a new checkpoint
+    journalFull = pyqtSignal()
+    # Emitted with the new data version after every change, for views of
+    # the whole data (e.g. the dashboard) rather than of single cells
+    dataVersionChanged = pyqtSignal(int)
+
     def __init__(self, path: str, default_bank: str):
         """
-        Initialize finance model.
+        Initialize finance model, the Qt face of a Ledger. Changes are made
+        through self.ledger, which tells the model about them, see
+        LedgerListener.
 
         Args:
-            path (str): path to a file, to load initial data.
+            path (str): path to a file, to load initial data. Either a CSV
+                or a native checkpoint (Arrow IPC/Parquet).
+            default_bank (str): bank set on CSV files data.
         """
         super(FinanceModel, self).__init__()
 
@@ -33,10 +40,14 @@ class FinanceModel(QtCore.QAbstractTableModel):
             'Banco/Corretora': "🏦"
         }
 
-        self.schema = FinanceSchema()
-        self.separator_defined = ';'
-        self._data = pre_process_csv(path, bank=default_bank)
-        self.default_bank = default_bank
+        # Sorted and/or filtered projection of the ledger shown to the views,
+        # view row -> ledger row. None shows the ledger as is.
+        self._view_rows = None
+        self._view_sort = None
+        self._view_filters = {}
+        # The journal is replayed before anyone watches the model
+        self.ledger = Ledger(path, default_bank)
+        self.ledger.listener = self
 
 
     def data(self, index: QModelIndex, role: Qt.ItemDataRole) -> str:
@@ -51,16 +62,13 @@ class FinanceModel(QtCore.QAbstractTableModel):
             str: value in str format
         """
         if role == Qt.ItemDataRole.DisplayRole:
-            value = self._data.item(row=index.row(), column=index.column())
-            if isinstance(value, float):
-                return f'{value:.2f}'
-            else:
-                return str(value)
+            return self.ledger.display_value(self._ledger_row(index.row()), index.column())
         # if role == Qt.ItemDataRole.InitialSortOrderRole:
         #     value = self._data.sort(pl.col(index))
         #     return str(value)
         #     return QSize(len(str(self._data.item(row=index.row(), column=index.column()))), 20)
 
+
     def setData(self, index, value, role=Qt.ItemDataRole.EditRole) -> bool:
         """
         Change model data
@@ -74,24 +82,7 @@ class FinanceModel(QtCore.QAbstractTableModel):
             bool: True if it was successful, or False if not.
         """
         if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
-            if not value:
-                return False
-            try:
-                # In case of Float
-                if self._data.dtypes[index.column()].is_float():
-                    self._data[index.row(), index.column()] = float(value)
-                # In case of Date
-                elif str(self._data.dtypes[index.column()].base_type()) == 'Date':
-                    self._data[index.row(), index.column()] = datetime.date.fromisoformat(value)
-                # In case of String
-                elif str(self._data.dtypes[index.column()].base_type()) == 'String':
-                    self._data[index.row(), index.column()] = value
-            except ValueError as e:
-                print(e)
-                return False
-            # self._data[index.row(), index.column()] = value
-            self.recalculate_data()
-            self.layoutChanged.emit()
+            return self.ledger.set_value(self._ledger_row(index.row()), index.column(), value)
         return True
 
 
@@ -105,7 +96,7 @@ class FinanceModel(QtCore.QAbstractTableModel):
         Returns:
             Qt.ItemFlag: flag set
         """
-        if self._data.columns[index.column()] == 'Saldo':
+        if self.ledger.data.columns[index.column()] == 'Saldo':
             return Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled
         else:
             return super().flags(index) | Qt.ItemFlag.ItemIsEditable
@@ -113,7 +104,7 @@ class FinanceModel(QtCore.QAbstractTableModel):
 
     def rowCount(self, index=QModelIndex()) -> int:
         """
-        Gives the total count of rows
+        Gives the total count of rows, of the view when it is sorted or filtered
 
         Args:
             index (QModelIndex, optional): Not used. Defaults to QModelIndex().
@@ -121,7 +112,9 @@ class FinanceModel(QtCore.QAbstractTableModel):
         Returns:
             int: Total rows
         """
-        return self._data.shape[0]
+        if self._view_rows is not None:
+            return len(self._view_rows)
+        return self.ledger.data.shape[0]
 
 
     def columnCount(self, index=QModelIndex()) -> int:
@@ -134,7 +127,7 @@ class FinanceModel(QtCore.QAbstractTableModel):
         Returns:
             int: Total columns
         """
-        return self._data.shape[1]
+        return self.ledger.data.shape[1]
 
 
     def remove_registry(self, index=QModelIndex()) -> bool:
@@ -147,14 +140,20 @@ class FinanceModel(QtCore.QAbstractTableModel):
         Returns:
             bool: True when success
         """
-        self.beginRemoveRows(QModelIndex(), self.rowCount(), self.rowCount()-1)
-        self._data = self._data.with_row_index()\
-                        .filter(pl.col('index') != index.row())\
-                        .drop('index')
-        self.recalculate_data()
-        self.endRemoveRows()
-        self.layoutChanged.emit()
-        return True
+        return self.remove_registries([index.row()])
+
+
+    def remove_registries(self, rows) -> bool:
+        """
+        Removes many registries at once, with a single pass over the data
+
+        Args:
+            rows (Iterable[int]): Row indexes to be removed, as seen by the views
+
+        Returns:
+            bool: True when success, False when there was nothing to remove
+        """
+        return self.ledger.remove_rows([self._ledger_row(row) for row in rows])
 
     def headerData(self, section, orientation, role) -> str:
         """
@@ -171,142 +170,179 @@ class FinanceModel(QtCore.QAbstractTableModel):
         # section is the index of the column/row.
         if role == Qt.ItemDataRole.DisplayRole:
             if orientation == Qt.Orientation.Horizontal:
-                return str(f"{self.column_name_icons[self._data.columns[section]]} {self._data.columns[section]}")
+                return str(f"{self.column_name_icons[self.ledger.data.columns[section]]} {self.ledger.data.columns[section]}")
 
             if orientation == Qt.Orientation.Vertical:
                 return str(section)
 
-    def add_registry(self, dict_row) -> bool:
+#------------------------ LEDGER LISTENER
+    def begin_change(self):
+        # With a sorted or filtered view active, the ledger positions the
+        # change is announced by mean nothing to the views, so the model is
+        # reset around it instead, and the view is rebuilt.
+        if self._view_rows is not None:
+            self.beginResetModel()
+
+    def end_change(self):
+        if self._view_rows is not None:
+            self._rebuild_view()
+            self.endResetModel()
+
+    def rows_inserting(self, first: int, last: int):
+        self._notify(self.beginInsertRows, QModelIndex(), first, last)
+
+    def rows_inserted(self):
+        self._notify(self.endInsertRows)
+
+    def rows_removing(self, first: int, last: int):
+        self._notify(self.beginRemoveRows, QModelIndex(), first, last)
+
+    def rows_removed(self):
+        self._notify(self.endRemoveRows)
+
+    def row_moving(self, row: int, destination: int):
+        self._notify(self.beginMoveRows, QModelIndex(), row, row, QModelIndex(), destination)
+
+    def row_moved(self):
+        self._notify(self.endMoveRows)
+
+    def cells_changed(self, first: int, last: int, column: int):
+        self._notify(self.dataChanged.emit, self.index(first, column), self.index(last, column))
+
+    def resetting(self):
+        self._notify(self.beginResetModel)
+
+    def reset(self):
+        self._notify(self.endResetModel)
+
+    def version_changed(self, version: int):
+        self.dataVersionChanged.emit(version)
+
+    def journal_full(self):
+        self.journalFull.emit()
+
+
+    def _notify(self, notification, *args):
         """
-        Adds a registry to the data
+        Announces a ledger change to the views. Skipped while a view is
+        active, since the model is reset around the change, see begin_change.
 
         Args:
-            dict_row (dict): A dictionary filled with:
-                date, description, operation and amount
+            notification (Callable): e.g. self.beginInsertRows
+            *args: Notification arguments, in ledger positions
+        """
+        if self._view_rows is None:
+            notification(*args)
+
+#------------------------ VIEW
+    def _ledger_row(self, row: int) -> int:
+        """
+        Maps a row as seen by the views to its ledger position.
+
+        Args:
+            row (int): View row
 
         Returns:
-            bool: True when success
+            int: Ledger row
         """
-        self.beginInsertRows(QModelIndex(), self.rowCount(), self.rowCount())
-        print(dict_row)
-        data_to_be_added = {
-            'Data': [dict_row['date']],
-            'Descrição': [dict_row['desc']],
-            'Valor': [dict_row['amount']] if dict_row['operation'] == 'Entrada' else [-dict_row['amount']],
-            'Saldo': [0.0],
-            'Categoria': ['Manually added!'],
-            'Banco/Corretora': self.default_bank
-        }
-        df_dict_row = pl.DataFrame(data_to_be_added, schema=self.schema)
-        self._data = pl.concat([self._data, df_dict_row], rechunk=True)
-        self.recalculate_data()
-        # self._data = self._data.with_columns(pl.col('Valor').cum_sum().alias('Saldo'))
-        self.endInsertRows()
-        self.layoutChanged.emit()
-        return True
+        if self._view_rows is None:
+            return row
+        return self._view_rows[row]
 
 
-    def add_rows(self, new_df) -> bool:
+    def sort(self, column: int, order=Qt.SortOrder.AscendingOrder):
         """
-        Adds a registry to the data
+        Sorts the view by a column. The ledger itself keeps its order, and
+        ties keep the ledger order between them.
 
         Args:
-            dict_row (dict): A dictionary filled with:
-                date, description, operation and amount
-
-        Returns:
-            bool: True when success
+            column (int): Column index, a negative one restores the ledger order
+            order (Qt.SortOrder, optional): Defaults to Qt.SortOrder.AscendingOrder.
         """
-        self.beginInsertRows(QModelIndex(), self.rowCount(), self.rowCount()+new_df.shape[0]-1)
-        self._data = pl.concat([self._data, new_df], rechunk=True)
-        self.recalculate_data()
-        # self._data = self._data.with_columns(pl.col('Valor').cum_sum().alias('Saldo'))
-        self.endInsertRows()
-        self.layoutChanged.emit()
-        return True
+        if column < 0:
+            self._view_sort = None
+        else:
+            self._view_sort = (self.ledger.data.columns[column], order == Qt.SortOrder.DescendingOrder)
+        self._refresh_view()
 
 
-    def recalculate_data(self):
+    def set_filter(self, name: str, value=None):
         """
-        Recalculates the cumulative sum.
+        Filters the view, on top of the filters already set.
+
+        Args:
+            name (str): Which filter:
+                'date': (start, end) dates, either may be None
+                'category': categories to keep
+                'bank': banks/brokers to keep
+                'amount': (min, max) Valor, either may be None
+                'text': text searched in Descrição and Categoria
+            value (optional): Filter value. Defaults to None, which clears it.
         """
-        self._data = self._data.sort(*self._data.columns)\
-                .with_columns(pl.col('Valor').cum_sum().alias('Saldo'))
+        if name not in ('date', 'category', 'bank', 'amount', 'text'):
+            raise ValueError(f'Filtro desconhecido: {name}')
+        if value is None or (name == 'text' and not value.strip()):
+            self._view_filters.pop(name, None)
+        else:
+            self._view_filters[name] = value
+        self._refresh_view()
 
 
-    def save_to_file(self, file) -> bool:
-        self._data.write_csv(file, separator=self.separator_defined,float_precision=2)
-        return True
+    def clear_filters(self):
+        self._view_filters.clear()
+        self._refresh_view()
+
+
+    def _filter_expr(self, name: str, value) -> pl.Expr:
+        """
+        Builds the polars predicate of a filter, see set_filter.
 
-#------------------------ QUERIES TO BE ADDED
-    def get_transactions_by(self, refresh_schedule: str):
-        match refresh_schedule:
-            case 'weekly':
-                trunc_str = '1w'
-            case 'monthly':
-                trunc_str = '1mo'
-            case 'quarterly':
-                trunc_str = '1q'
-            case 'yearly':
-                trunc_str = '1y'
-            case 'daily' | _:
-                trunc_str = '1d'
-        return self._data\
-            .group_by(pl.col('Data').dt.truncate(trunc_str), 'Descrição', 'Categoria')\
-            .agg(pl.col('Valor').sum())\
-            .sort('Data')\
-            .to_dict()
-            # .filter(pl.col(self.column_name_maps['cat']).str.contains('Pix'))\
-            #.dt.truncate('1mo')
-
-
-    def get_top_significant_expenses_by_category(self):
-        return self._data\
-            .group_by('Categoria')\
-            .agg(pl.col('Valor').abs().sum())\
-            .sort(by=pl.col('Valor'),descending=True)\
-            .select('Categoria', 'Valor')\
-            .to_dict(as_series=False)
-
-
-    def get_distribution_by_bank(self):
-        # return self._data\
-        #     .group_by('Banco/Corretora')\
-        #     .agg(pl.col('Valor').abs().sum())\
-        #     .sort(by=pl.col('Valor'),descending=True)\
-        #     .select('Banco/Corretora', 'Valor')\
-        #     .to_dict(as_series=False)
-        invest = self._data.filter(Categoria='Aplicacao')\
-                            .select('Banco/Corretora', 'Valor')\
-                            .group_by('Banco/Corretora')\
-                            .sum()\
-                            .select('Banco/Corretora', pl.col('Valor').abs())
-        current = self._data.group_by('Banco/Corretora')\
-                            .agg(pl.col('Saldo').last())\
-                            .select('Banco/Corretora', pl.col('Saldo').abs().alias('Valor'))
-        return pl.concat([current, invest], how='vertical')\
-            .group_by('Banco/Corretora').sum()\
-            .sort(by=pl.col('Valor'),descending=True)\
-            .to_dict(as_series=False)
-
-
-    def get_total_amount_by(self, refresh_schedule: str ):
-        match refresh_schedule:
-            case 'weekly':
-                trunc_str = '1w'
-            case 'monthly':
-                trunc_str = '1mo'
-            case 'quarterly':
-                trunc_str = '1q'
-            case 'yearly':
-                trunc_str = '1y'
-            case 'daily' | _:
-                trunc_str = '1d'
-        return self._data\
-            .select(
-                pl.col('Data').dt.truncate(trunc_str),
-                pl.col('Saldo').last().over(pl.col('Data').dt.truncate(trunc_str)).alias('Saldo período')
-                ).sort('Data').to_dict()
-
-    # def get_current_amount(self):
-    #     return self._data.select('Data', 'Saldo').to_dict()
\ No newline at end of file
+        Args:
+            name (str): Which filter
+            value: Filter value
+
+        Returns:
+            pl.Expr: Predicate
+        """
+        match name:
+            case 'date' | 'amount':
+                column = pl.col('Data') if name == 'date' else pl.col('Valor')
+                low, high = value
+                expr = pl.lit(True)
+                if low is not None:
+                    expr = expr & (column >= low)
+                if high is not None:
+                    expr = expr & (column <= high)
+                return expr
+            case 'category':
+                return pl.col('Categoria').is_in(list(value))
+            case 'bank':
+                return pl.col('Banco/Corretora').is_in(list(value))
+            case 'text':
+                expr = pl.lit(True)
+                for values in self.ledger.search_index.search(value, self.ledger.data):
+                    values = list(values)
+                    expr = expr & (pl.col('Descrição').is_in(values) | pl.col('Categoria').is_in(values))
+                return expr
+
+
+    def _rebuild_view(self):
+        """
+        Recomputes the view rows from the ledger, the filters and the sort.
+        """
+        if self._view_sort is None and not self._view_filters:
+            self._view_rows = None
+            return
+        view = self.ledger.data.lazy().with_row_index('Linha')
+        for name, value in self._view_filters.items():
+            view = view.filter(self._filter_expr(name, value))
+        if self._view_sort is not None:
+            column, descending = self._view_sort
+            view = view.sort(column, descending=descending, maintain_order=True)
+        self._view_rows = view.select('Linha').collect().get_column('Linha').to_list()
+
+
+    def _refresh_view(self):
+        self.beginResetModel()
+        self._rebuild_view()
+        self.endResetModel()
@@ -0,0 +1,249 @@
+import os
+import json
+import polars as pl
+from typing import Iterator
+from schema.finance import FinanceSchema
+
+# Ask for a compaction once the journal has this many records...
+JOURNAL_COMPACT_RECORDS = 1000
+# ... or grows past this many bytes
+JOURNAL_COMPACT_SIZE = 8 * 1024 * 1024
+# Bytes read at a time, from the end, looking for the last complete line
+JOURNAL_SCAN_CHUNK = 64 * 1024
+
+
+def base_identity(path: str) -> dict:
+    """
+    Identity of a base file, which changes whenever the file is rewritten.
+
+    Args:
+        path (str): Base file path
+
+    Returns:
+        dict: size and mtime_ns, both None when the file does not exist
+    """
+    if not os.path.exists(path):
+        return {'size': None, 'mtime_ns': None}
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class ChangeJournal():
+    def __init__(self, path: str, base_path: str) -> None:
+        """
+        Append-only journal of changes made on top of a base file. Each change
+        is a JSON line, flushed to the disk right away.
+        The first line identifies the base file, a journal left over from a
+        different one, e.g. the base was replaced by another program, is set
+        aside instead of being replayed onto the wrong rows.
+
+        Args:
+            path (str): Journal path, usually the base file path + '.journal'
+            base_path (str): Base file the changes are made on top of
+        """
+        self.path = path
+        self.base_path = base_path
+        self._file = None
+        self.records = 0
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+
+
+    def append(self, op: str, **payload) -> None:
+        """
+        Appends a change to the journal.
+
+        Args:
+            op (str): Operation name ('insert', 'set' or 'remove')
+            **payload: Operation arguments, must be JSON serializable
+        """
+        if self._file is None:
+            self._drop_partial_line()
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if not self.size:
+                self._write_line({'op': 'base', **base_identity(self.base_path)})
+        self._write_line({'op': op, **payload})
+        self.records += 1
+
+
+    def _write_line(self, record: dict) -> None:
+        """
+        Writes a record as a JSON line, flushed to the disk.
+
+        Args:
+            record (dict): JSON serializable record
+        """
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        self._file.write(line)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.size += len(line.encode('utf-8'))
+
+
+    def _drop_partial_line(self) -> None:
+        """
+        Cuts a line left unfinished by a crash off the end of the journal,
+        before anything is appended to it, so the next record does not end
+        up glued to it. A line only missing its newline is kept, since it
+        was replayed.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            start = end
+            # Walks back to the last newline, a chunk at a time
+            while start > 0:
+                chunk_start = max(start - JOURNAL_SCAN_CHUNK, 0)
+                f.seek(chunk_start)
+                newline = f.read(start - chunk_start).rfind(b'\n')
+                if newline >= 0:
+                    start = chunk_start + newline + 1
+                    break
+                start = chunk_start
+            if start == end:
+                return
+            f.seek(start)
+            try:
+                json.loads(f.read(end - start))
+                f.write(b'\n')
+            except ValueError:
+                print(f'Registro incompleto removido do journal {self.path}')
+                f.truncate(start)
+            self.size = f.seek(0, os.SEEK_END)
+
+
+    def replay(self) -> Iterator[dict]:
+        """
+        Reads every change recorded so far. Lines which are not valid JSON,
+        e.g. a truncated last line left by a crash while writing it, are
+        skipped. A journal of another base file is renamed to path +
+        '.orphan', and nothing is replayed.
+
+        Yields:
+            Iterator[dict]: Recorded changes, oldest first
+        """
+        if not self.size:
+            return
+        if not self._matches_base():
+            print(f'Journal {self.path} não corresponde a {self.base_path}, '
+                  f'movido para {self.path}.orphan sem ser aplicado')
+            os.replace(self.path, f'{self.path}.orphan')
+            self.size = 0
+            return
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            # Skips the base record
+            f.readline()
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f'Registro inválido ignorado no journal {self.path}: {line[:80]!r}')
+                    continue
+                self.records += 1
+                yield record
+
+
+    def move(self, path: str, base_path: str) -> None:
+        """
+        Moves the recorded changes over to another base file holding the
+        same data, e.g. a checkpoint of the CSV file they were made on top
+        of. A journal already at path, left over from an older base file,
+        is renamed to path + '.orphan'.
+
+        Args:
+            path (str): New journal path
+            base_path (str): New base file
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        lines = []
+        if self.size:
+            self._drop_partial_line()
+            with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+                # The base record is written again, for the new base file
+                lines = f.readlines()[1:]
+        if os.path.exists(path):
+            os.replace(path, f'{path}.orphan')
+        old_path = self.path
+        self.path, self.base_path, self.size = path, base_path, 0
+        if not lines:
+            return
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._write_line({'op': 'base', **base_identity(self.base_path)})
+        self._file.write(''.join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.size = self._file.tell()
+        os.remove(old_path)
+
+
+    def _matches_base(self) -> bool:
+        """
+        Checks the base record, the journal's first line, against the base
+        file as it is now.
+
+        Returns:
+            bool: True when the journal was recorded on top of this base file
+        """
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            first_line = f.readline()
+        try:
+            record = json.loads(first_line)
+        except ValueError:
+            return False
+        return isinstance(record, dict) and record.get('op') == 'base' and \
+            {key: record.get(key) for key in ('size', 'mtime_ns')} == base_identity(self.base_path)
+
+
+    def needs_compaction(self) -> bool:
+        """
+        Tells whether the journal should be folded into a new base file.
+
+        Returns:
+            bool: True when it grew past the limits
+        """
+        return self.records >= JOURNAL_COMPACT_RECORDS or self.size >= JOURNAL_COMPACT_SIZE
+
+
+    def discard(self) -> None:
+        """
+        Closes and deletes the journal, once its changes are part of a base file.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.records = 0
+        self.size = 0
+
+
+def frame_to_record(df: pl.DataFrame) -> dict:
+    """
+    Encodes rows to be journaled, column by column.
+
+    Args:
+        df (pl.DataFrame): Rows in the FinanceSchema
+
+    Returns:
+        dict: JSON serializable columns
+    """
+    return df.with_columns(pl.col(pl.Date).cast(pl.String)).to_dict(as_series=False)
+
+
+def record_to_frame(record: dict) -> pl.DataFrame:
+    """
+    Decodes rows encoded by frame_to_record.
+
+    Args:
+        record (dict): Journaled columns
+
+    Returns:
+        pl.DataFrame: Rows in the FinanceSchema
+    """
+    schema = FinanceSchema()
+    return pl.DataFrame(record, schema_overrides={'Data': pl.String()})\
+        .with_columns(pl.col('Data').str.to_date('%Y-%m-%d'))\
+        .cast(dict(schema))\
+        .select(schema.keys())
@@ -0,0 +1,922 @@
+import polars as pl
+import bisect
+import functools
+import heapq
+import datetime
+import os
+from polars import DataFrame
+from schema.finance import FinanceSchema
+from preprocess_lib.checkpoint import detect_checkpoint, load_file, save_checkpoint
+from preprocess_lib.categorize import CategoryRules, load_rules
+from models.journal import ChangeJournal, frame_to_record, record_to_frame
+from models.cache import QueryCache, versioned_query
+from models.dashboard import DashboardSnapshot
+from models.rollup import PeriodRollup, truncate_period
+from models.search import SearchIndex
+from models.duplicates import DuplicateIndex
+
+# Columns which define the ledger order. Saldo is left out, since it is
+# derived from the order itself.
+LEDGER_SORT_KEY = ('Data', 'Descrição', 'Valor', 'Categoria', 'Banco/Corretora')
+# Half a cent, rounding differences between Saldo and the sum of Valor
+BALANCE_TOLERANCE = 0.005
+# Splicing rows in and out fragments the frame, rechunk past this many chunks
+MAX_LEDGER_CHUNKS = 64
+# Imports up to this many rows are spliced in one by one instead of re-sorted
+INCREMENTAL_MAX_ROWS = 16
+# Scattered removals are announced range by range up to this many ranges,
+# past it listeners are told about a reset instead
+INCREMENTAL_MAX_RANGES = 16
+# Column sizing samples this many rows from the head and from the tail...
+COLUMN_SAMPLE_ROWS = 50
+# ...plus this many of the longest values of the column
+COLUMN_SAMPLE_WIDEST = 8
+
+
+class LedgerListener():
+    """
+    Receives the changes made to a Ledger, in ledger positions, e.g. to
+    announce them to Qt views. Every method does nothing here, which is
+    what headless use needs.
+    """
+    def begin_change(self):
+        """A public change starts, the notifications below follow."""
+
+    def end_change(self):
+        """The public change is over."""
+
+    def rows_inserting(self, first: int, last: int):
+        pass
+
+    def rows_inserted(self):
+        pass
+
+    def rows_removing(self, first: int, last: int):
+        pass
+
+    def rows_removed(self):
+        pass
+
+    def row_moving(self, row: int, destination: int):
+        """row goes right before destination, counted with row still in place."""
+
+    def row_moved(self):
+        pass
+
+    def cells_changed(self, first: int, last: int, column: int):
+        pass
+
+    def resetting(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def version_changed(self, version: int):
+        pass
+
+    def journal_full(self):
+        """The change journal should be folded into a new checkpoint."""
+
+
+def ledger_change(method):
+    """
+    Wraps a public ledger change between listener.begin_change() and
+    listener.end_change().
+
+    Args:
+        method (Callable): Ledger method which changes the data
+
+    Returns:
+        Callable: Wrapped method
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.listener.begin_change()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.listener.end_change()
+    return wrapper
+
+
+class Ledger():
+    def __init__(self, path: str, default_bank: str, listener: LedgerListener | None = None):
+        """
+        Every transaction, kept sorted by LEDGER_SORT_KEY with its running
+        balance, along with the indexes, caches and queries built on top of
+        it. Nothing here depends on Qt, views get the changes through a
+        LedgerListener.
+
+        Args:
+            path (str): path to a file, to load initial data. Either a CSV
+                or a native checkpoint (Arrow IPC/Parquet).
+            default_bank (str): bank set on CSV files data.
+            listener (LedgerListener | None, optional): Receives the changes.
+                Defaults to None, which ignores them.
+        """
+        self.listener = listener if listener is not None else LedgerListener()
+        self.schema = FinanceSchema()
+        self.separator_defined = ';'
+        self._data = load_file(path, bank=default_bank)
+        self.default_bank = default_bank
+        # Pre-formatted display values, column index -> list of str
+        self._display_cache = {}
+        # Longest display values, column index -> list of str. Removed values
+        # are kept, so they bound the column width from above.
+        self._widest_values = {}
+        # Bumped on every change, query results are cached per version
+        self.data_version = 0
+        self.query_cache = QueryCache()
+        # Keep the ledger sorted from the start, so edits can be incremental.
+        # Checkpoints are saved in ledger order already.
+        if not (detect_checkpoint(path) and self._in_ledger_order()):
+            self.recalculate_data()
+        self.rollup = PeriodRollup()
+        self.search_index = SearchIndex()
+        self.duplicates = DuplicateIndex()
+        # CSV files are parsed on every launch, the data as parsed is kept
+        # until checkpoint_base saves it
+        self._base_data = None if detect_checkpoint(path) else self._data
+        # Changes made since the base file was saved
+        self.journal = None
+        self.replay_journal(ChangeJournal(f'{path}.journal', path))
+
+
+    @property
+    def data(self) -> DataFrame:
+        """
+        The ledger itself. It is never changed in place, every change
+        replaces the frame, so a reference to it is a snapshot.
+        """
+        return self._data
+
+
+    def cached_display_columns(self) -> list[int]:
+        """
+        Columns whose display values are cached. Saldo is left out, since
+        an edit may change it from the edited row to the end of the ledger,
+        it is formatted cell by cell as it is displayed instead.
+
+        Returns:
+            list[int]: Column indexes
+        """
+        return [column for column, name in enumerate(self._data.columns) if name != 'Saldo']
+
+
+    def display_column(self, column: int) -> list[str]:
+        """
+        Retrieves the display values of a whole column, formatting them
+        once and keeping them cached until the column is invalidated, see
+        cached_display_columns.
+
+        Args:
+            column (int): Column index
+
+        Returns:
+            list[str]: Formatted values, one per row
+        """
+        values = self._display_cache.get(column)
+        if values is None:
+            values = self._format_values(self._data.to_series(column))
+            if column in self.cached_display_columns():
+                self._display_cache[column] = values
+        return values
+
+
+    def display_value(self, row: int, column: int) -> str:
+        """
+        Retrieves a single display value, from the cache when the column
+        is cached, otherwise formatting just that value, so the first
+        repaint does not have to format whole columns.
+
+        Args:
+            row (int): Ledger row
+            column (int): Column index
+
+        Returns:
+            str: Formatted value
+        """
+        values = self._display_cache.get(column)
+        if values is not None:
+            return values[row]
+        return self._format_values(self._data.to_series(column).slice(row, 1))[0]
+
+
+    def _format_values(self, series: pl.Series) -> list[str]:
+        """
+        Formats a series the way it is displayed on the table.
+
+        Args:
+            series (pl.Series): Values to be formatted
+
+        Returns:
+            list[str]: Formatted values
+        """
+        if series.dtype.is_float():
+            return [f'{value:.2f}' if value is not None else str(value)
+                    for value in series.to_list()]
+        return [str(value) for value in series.to_list()]
+
+
+    def invalidate_display_cache(self, columns=None):
+        """
+        Drops cached display values, so they are formatted again on the
+        next repaint.
+
+        Args:
+            columns (Iterable[str], optional): Column names to invalidate.
+                Defaults to None, which invalidates every column.
+        """
+        if columns is None:
+            self._display_cache.clear()
+            self._widest_values.clear()
+            return
+        for column in columns:
+            self._display_cache.pop(self._data.get_column_index(column), None)
+            self._widest_values.pop(self._data.get_column_index(column), None)
+
+
+    def widest_values(self, column: int) -> list[str]:
+        """
+        Longest display values of a column, kept up to date as rows are
+        inserted, so sizing the column never reads every row again.
+
+        Args:
+            column (int): Column index
+
+        Returns:
+            list[str]: Up to COLUMN_SAMPLE_WIDEST values, longest first
+        """
+        values = self._widest_values.get(column)
+        if values is None:
+            values = heapq.nlargest(COLUMN_SAMPLE_WIDEST, self._format_values(self._widest_candidates(column)), key=len)
+            self._widest_values[column] = values
+        return values
+
+
+    def _widest_candidates(self, column: int) -> pl.Series:
+        """
+        Values of a column which format the longest, found without
+        formatting the whole column: the longest texts, the extremes of
+        numbers (their width grows with the magnitude) and any value of
+        fixed width types, e.g. dates.
+
+        Args:
+            column (int): Column index
+
+        Returns:
+            pl.Series: Candidate values
+        """
+        series = self._data.to_series(column)
+        if series.dtype == pl.String:
+            candidates = pl.DataFrame([series, series.str.len_chars().alias('Tamanho')])\
+                .top_k(COLUMN_SAMPLE_WIDEST, by='Tamanho')\
+                .to_series(0)
+        elif series.dtype.is_numeric():
+            candidates = pl.Series([series.min(), series.max()], dtype=series.dtype)
+        else:
+            candidates = series.drop_nulls().head(1)
+        if series.null_count():
+            candidates = candidates.extend_constant(None, 1)
+        return candidates
+
+
+    def _merge_widest(self, column: int, new_values: list[str]):
+        """
+        Merges new display values into the longest values of a column.
+
+        Args:
+            column (int): Column index
+            new_values (list[str]): Values inserted into the column
+        """
+        if column in self._widest_values:
+            self._widest_values[column] = heapq.nlargest(
+                COLUMN_SAMPLE_WIDEST, self._widest_values[column] + new_values, key=len)
+
+
+    def column_sample(self, column: int) -> list[str]:
+        """
+        Display values to size a column by: the head and the tail of the
+        ledger, plus the longest values of the column.
+
+        Args:
+            column (int): Column index
+
+        Returns:
+            list[str]: Sampled values
+        """
+        series = self._data.to_series(column)
+        return self._format_values(series.head(COLUMN_SAMPLE_ROWS))\
+            + self._format_values(series.tail(COLUMN_SAMPLE_ROWS))\
+            + self.widest_values(column)
+
+
+    @ledger_change
+    def set_value(self, row: int, column: int, value: str) -> bool:
+        """
+        Changes a single value, moving its row to where it belongs now.
+
+        Args:
+            row (int): Ledger row
+            column (int): Column index
+            value (str): value to be set, as typed
+
+        Returns:
+            bool: True if it was successful, or False if not.
+        """
+        if not value:
+            return False
+        raw_value = value
+        dtype = self._data.dtypes[column]
+        try:
+            # In case of Float
+            if dtype.is_float():
+                value = float(value)
+            # In case of Date
+            elif str(dtype.base_type()) == 'Date':
+                value = datetime.date.fromisoformat(value)
+        except ValueError as e:
+            print(e)
+            return False
+        # The edited row may belong somewhere else now, move it there
+        edited_row = self._data.slice(row, 1)\
+            .with_columns(pl.lit(value, dtype=dtype).alias(self._data.columns[column]))
+        # Searched with the row still in place, which is what Qt expects
+        destination = self._insertion_point(edited_row.row(0))
+        moved = destination not in (row, row+1)
+        if moved:
+            self.listener.row_moving(row, destination)
+        self._delete_rows(row)
+        position = self._insert_rows(edited_row, destination-1 if destination > row else destination)
+        # A row which stays in place keeps its balance, unless its amount changed
+        saldo_changed = moved or self._data.columns[column] in ('Valor', 'Saldo')
+        if saldo_changed:
+            self._rebalance_from(min(row, position))
+        if moved:
+            self.listener.row_moved()
+        self.listener.cells_changed(position, position, column)
+        if saldo_changed:
+            self._saldo_changed(min(row, position))
+        self._journal_append('set', row=row, column=column, value=raw_value)
+        self._data_changed()
+        return True
+
+
+    @ledger_change
+    def remove_rows(self, rows) -> bool:
+        """
+        Removes many registries at once, with a single pass over the data
+
+        Args:
+            rows (Iterable[int]): Ledger rows to be removed
+
+        Returns:
+            bool: True when success, False when there was nothing to remove
+        """
+        rows = sorted(set(rows))
+        if not rows:
+            return False
+        first = rows[0]
+        # Contiguous ranges, as (first row, row count)
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][0] + ranges[-1][1] == row:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([row, 1])
+        if len(ranges) <= INCREMENTAL_MAX_RANGES:
+            # Last range first, so the rows of the others keep their positions
+            for row, count in reversed(ranges):
+                self.listener.rows_removing(row, row+count-1)
+                self._delete_rows(row, count)
+                self.listener.rows_removed()
+            self._rebalance_from(first)
+            self._saldo_changed(first)
+        else:
+            self.listener.resetting()
+            removed_rows = pl.int_range(pl.len()).is_in(rows)
+            removed_data = self._data.filter(removed_rows)
+            self.rollup.remove(removed_data)
+            self.search_index.remove(removed_data)
+            self.duplicates.remove(removed_data)
+            self._data = self._data.filter(~removed_rows)
+            removed = set(rows)
+            for column, values in self._display_cache.items():
+                self._display_cache[column] = [value for row, value in enumerate(values)
+                                               if row not in removed]
+            self._rebalance_from(first)
+            self.listener.reset()
+        self._journal_append('remove', rows=rows)
+        self._data_changed()
+        return True
+
+
+    @ledger_change
+    def add_registry(self, dict_row) -> bool:
+        """
+        Adds a registry to the data
+
+        Args:
+            dict_row (dict): A dictionary filled with:
+                date, description, operation and amount
+
+        Returns:
+            bool: True when success
+        """
+        category = load_rules().categorize(pl.Series([dict_row['desc']], dtype=pl.String))[0]
+        data_to_be_added = {
+            'Data': [dict_row['date']],
+            'Descrição': [dict_row['desc']],
+            'Valor': [dict_row['amount']] if dict_row['operation'] == 'Entrada' else [-dict_row['amount']],
+            'Saldo': [0.0],
+            'Categoria': [category or 'Manually added!'],
+            'Banco/Corretora': self.default_bank
+        }
+        df_dict_row = pl.DataFrame(data_to_be_added, schema=self.schema)
+        position = self._insertion_point(df_dict_row.row(0))
+        self.listener.rows_inserting(position, position)
+        self._rebalance_from(self._insert_rows(df_dict_row, position))
+        self.listener.rows_inserted()
+        self._saldo_changed(position+1)
+        self._journal_append('insert', rows=frame_to_record(df_dict_row))
+        # self._data = self._data.with_columns(pl.col('Valor').cum_sum().alias('Saldo'))
+        self._data_changed()
+        return True
+
+
+    @ledger_change
+    def add_rows(self, new_df, skip_duplicates: bool = True) -> int:
+        """
+        Adds imported rows to the data, skipping the ones already in it,
+        see DuplicateIndex.new_rows.
+
+        Args:
+            new_df (DataFrame | list[DataFrame]): Rows of one statement, or a
+                list of statements, each one checked against the ledger and
+                the statements before it.
+            skip_duplicates (bool, optional): Whether to skip rows already in
+                the data. Defaults to True.
+
+        Returns:
+            int: How many rows were skipped as duplicates
+        """
+        statements = new_df if isinstance(new_df, list) else [new_df]
+        if not statements:
+            return 0
+        skipped = 0
+        if skip_duplicates:
+            accepted = {}
+            kept = [self.duplicates.new_rows(statement, self._data, accepted) for statement in statements]
+            skipped = sum(statement.shape[0] for statement in statements) - sum(df.shape[0] for df in kept)
+            statements = kept
+        new_df = pl.concat(statements, how='vertical', rechunk=True) if len(statements) > 1 else statements[0]
+        if new_df.is_empty():
+            return skipped
+        new_df = new_df.sort(*LEDGER_SORT_KEY)
+        position = self._insertion_point(new_df.row(0))
+        if position == self._data.height:
+            # Newer statement, it only extends the ledger
+            self.listener.rows_inserting(position, position+new_df.shape[0]-1)
+            self._rebalance_from(self._insert_rows(new_df, position))
+            self.listener.rows_inserted()
+        elif new_df.shape[0] <= INCREMENTAL_MAX_ROWS:
+            for idx in range(new_df.shape[0]):
+                row = new_df.slice(idx, 1)
+                row_position = self._insertion_point(row.row(0))
+                self.listener.rows_inserting(row_position, row_position)
+                self._insert_rows(row, row_position)
+                self.listener.rows_inserted()
+            self._rebalance_from(position)
+            self._saldo_changed(position)
+        else:
+            self.listener.resetting()
+            self.rollup.add(new_df)
+            self.search_index.add(new_df)
+            self.duplicates.add(new_df)
+            self._data = pl.concat([self._data, new_df], rechunk=True)
+            self.recalculate_data()
+            self.invalidate_display_cache()
+            self.listener.reset()
+        # self._data = self._data.with_columns(pl.col('Valor').cum_sum().alias('Saldo'))
+        self._journal_append('insert', rows=frame_to_record(new_df))
+        self._data_changed()
+        return skipped
+
+
+    @ledger_change
+    def recategorize(self, rules: CategoryRules | None = None) -> int:
+        """
+        Categorizes the whole ledger again, e.g. after the rules changed.
+        Rows no rule matches keep their category.
+
+        Args:
+            rules (CategoryRules | None, optional): Rules to apply. Defaults to
+                None, which loads them from the rules file.
+
+        Returns:
+            int: How many rows changed category
+        """
+        rules = rules if rules is not None else load_rules()
+        categorized = rules.apply(self._data)
+        changed_rows = categorized.get_column('Categoria')\
+            .ne_missing(self._data.get_column('Categoria'))
+        changed = changed_rows.sum()
+        if not changed:
+            return 0
+        self.listener.resetting()
+        # Only the changed categories are reindexed
+        self.search_index.remove(self._data.filter(changed_rows))
+        self.search_index.add(categorized.filter(changed_rows))
+        self._data = categorized
+        # Categoria is part of the ledger order, and of every aggregation
+        self.recalculate_data()
+        self.invalidate_display_cache()
+        self.rollup = PeriodRollup()
+        self.listener.reset()
+        self._journal_append('recategorize', rules=rules.rules)
+        self._data_changed()
+        return changed
+
+
+    def recalculate_data(self) -> bool:
+        """
+        Recalculates the whole ledger, sorting it and the cumulative sum.
+
+        Returns:
+            bool: True when the sort moved any row
+        """
+        sorted_data = self._data.with_row_index()\
+                .sort(*LEDGER_SORT_KEY)
+        self._data = sorted_data.drop('index')\
+                .with_columns(pl.col('Valor').cum_sum().alias('Saldo'))
+        return not sorted_data.get_column('index').is_sorted()
+
+
+    def _in_ledger_order(self) -> bool:
+        """
+        Tells whether a loaded checkpoint can be used as it is. They are
+        saved from the ledger itself, so only a cheap check is made: Data
+        must be sorted and the last Saldo must match the sum of Valor. A
+        full check of LEDGER_SORT_KEY costs about as much as sorting.
+
+        Returns:
+            bool: True when the data looks sorted, with its running balance
+        """
+        if not self._data.get_column('Data').is_sorted():
+            return False
+        balance = self._data.get_column('Saldo').drop_nulls().tail(1)
+        total = self._data.get_column('Valor').sum()
+        return balance.is_empty() or abs(balance.item() - total) < BALANCE_TOLERANCE
+
+
+    def _sort_key(self, values: tuple) -> tuple:
+        """
+        Builds a comparable key in the same order polars sorts the ledger,
+        with nulls first.
+
+        Args:
+            values (tuple): Values of the LEDGER_SORT_KEY columns
+
+        Returns:
+            tuple: Comparable key
+        """
+        return tuple((value is not None, value) for value in values)
+
+
+    def _insertion_point(self, row: tuple) -> int:
+        """
+        Binary searches where a row belongs in the sorted ledger. Data narrows
+        it down first, then the remaining key columns break ties.
+
+        Args:
+            row (tuple): Row values, in the ledger column order
+
+        Returns:
+            int: Position right after any equal row
+        """
+        row = dict(zip(self._data.columns, row))
+        dates = self._data.get_column('Data')
+        nulls = dates.null_count()
+        if row['Data'] is None:
+            low, high = 0, nulls
+        else:
+            dates = dates.slice(nulls)
+            low = nulls + dates.search_sorted(row['Data'], side='left')
+            high = nulls + dates.search_sorted(row['Data'], side='right')
+        if low == high:
+            return low
+        same_date = self._data.slice(low, high-low).select(LEDGER_SORT_KEY).rows()
+        key = self._sort_key(tuple(row[column] for column in LEDGER_SORT_KEY))
+        return low + bisect.bisect_right(same_date, key, key=self._sort_key)
+
+
+    def _insert_rows(self, new_df: DataFrame, position: int | None = None) -> int:
+        """
+        Splices rows into the ledger, at the position of the first one.
+        Saldo is left untouched, see _rebalance_from.
+
+        Args:
+            new_df (DataFrame): Sorted rows, which must all fit at that position
+            position (int | None, optional): Insertion point, when already
+                searched. Defaults to None.
+
+        Returns:
+            int: Position where the rows were inserted
+        """
+        if position is None:
+            position = self._insertion_point(new_df.row(0)) if not new_df.is_empty() else self._data.height
+        self.rollup.add(new_df)
+        self.search_index.add(new_df)
+        self.duplicates.add(new_df)
+        self._data = pl.concat([
+            self._data.slice(0, position),
+            new_df.select(self._data.columns),
+            self._data.slice(position)
+            ])
+        saldo_column = self._data.get_column_index('Saldo')
+        # Saldo is not final until _rebalance_from, its widest values are
+        # merged there
+        for column in (self._display_cache.keys() | self._widest_values.keys()) - {saldo_column}:
+            new_values = self._format_values(
+                self._data.to_series(column).slice(position, new_df.shape[0]))
+            if column in self._display_cache:
+                self._display_cache[column][position:position] = new_values
+            self._merge_widest(column, new_values)
+        return position
+
+
+    def _delete_rows(self, row: int, count: int = 1):
+        """
+        Cuts rows out of the ledger. Saldo is left untouched, see _rebalance_from.
+
+        Args:
+            row (int): First row to be removed
+            count (int, optional): How many rows. Defaults to 1.
+        """
+        removed = self._data.slice(row, count)
+        self.rollup.remove(removed)
+        self.search_index.remove(removed)
+        self.duplicates.remove(removed)
+        self._data = pl.concat([
+            self._data.slice(0, row),
+            self._data.slice(row+count)
+            ])
+        for values in self._display_cache.values():
+            del values[row:row+count]
+
+
+    def _rebalance_from(self, position: int):
+        """
+        Recalculates the cumulative sum only from position onwards. The sum is
+        seeded with the balance right before it, so it matches a full
+        recalculation exactly.
+
+        Args:
+            position (int): First row whose Saldo may have changed
+        """
+        if self._data.n_chunks() > MAX_LEDGER_CHUNKS:
+            self._data = self._data.rechunk()
+        if position >= self._data.height:
+            return
+        saldo = self._data.get_column('Saldo')
+        balance = saldo.slice(position-1, 1) if position else saldo.clear()
+        if balance.null_count():
+            # Valor was null there, the running sum carries on from before it
+            balance = saldo.slice(0, position).drop_nulls().tail(1)
+        suffix = self._data.get_column('Valor').slice(position).alias('Saldo')
+        if balance.is_empty():
+            suffix = suffix.cum_sum()
+        else:
+            suffix = pl.concat([balance, suffix]).cum_sum().slice(1)
+        self._data = self._data.with_columns(
+            pl.concat([saldo.slice(0, position), suffix]))
+        # Balances widen with their magnitude, only the extremes of the
+        # new ones can be wider than the widest ones known so far
+        self._merge_widest(self._data.get_column_index('Saldo'),
+                           self._format_values(pl.Series([suffix.min(), suffix.max()], dtype=suffix.dtype)))
+
+
+    def _saldo_changed(self, position: int):
+        """
+        Tells the listener that Saldo changed from position onwards.
+
+        Args:
+            position (int): First row whose Saldo changed
+        """
+        if position >= self._data.height:
+            return
+        self.listener.cells_changed(position, self._data.height-1, self._data.get_column_index('Saldo'))
+
+
+    def _data_changed(self):
+        """
+        Bumps the data version, so cached query results are not used
+        anymore, and tells the listener about it.
+        """
+        self.data_version += 1
+        self.listener.version_changed(self.data_version)
+
+
+    def cache_info(self) -> dict:
+        """
+        Query cache statistics.
+
+        Returns:
+            dict: hits, misses, current size and maxsize
+        """
+        return self.query_cache.info()
+
+
+    def replay_journal(self, journal: ChangeJournal):
+        """
+        Re-applies the changes recorded in a journal on top of the loaded
+        data, then keeps recording new changes into it.
+
+        Args:
+            journal (ChangeJournal): Journal of the loaded base file
+        """
+        self.journal = None
+        for record in journal.replay():
+            match record['op']:
+                case 'insert':
+                    # Duplicates were skipped when the rows were recorded
+                    self.add_rows(record_to_frame(record['rows']), skip_duplicates=False)
+                case 'set':
+                    self.set_value(record['row'], record['column'], record['value'])
+                case 'remove':
+                    self.remove_rows(record['rows'])
+                case 'recategorize':
+                    self.recategorize(CategoryRules(record['rules']))
+        self.journal = journal
+
+
+    def attach_journal(self, path: str):
+        """
+        Starts a new, empty, journal for a new base file. The current journal
+        is discarded, so call it only once the data is saved into path.
+
+        Args:
+            path (str): New base file path
+        """
+        if self.journal is not None:
+            self.journal.discard()
+        self.journal = ChangeJournal(f'{path}.journal', path)
+        self.journal.discard()
+
+
+    def checkpoint_base(self, path: str) -> bool:
+        """
+        Saves the data parsed from the CSV file, as it was before any
+        journaled change, into a native checkpoint, and moves the journal
+        over to it. The changes stay recorded, on top of the checkpoint.
+        The checkpoint is written aside and then renamed, so a crash never
+        leaves a partial one behind.
+
+        Args:
+            path (str): Checkpoint path, ending with '.arrow'
+
+        Returns:
+            bool: True if it was saved, False if the data was not loaded from
+            a CSV file or its checkpoint was saved already
+        """
+        if self._base_data is None:
+            return False
+        root, extension = os.path.splitext(path)
+        partial_path = f'{root}.partial{extension}'
+        if not save_checkpoint(self._base_data, partial_path):
+            return False
+        os.replace(partial_path, path)
+        self._base_data = None
+        if self.journal is not None:
+            self.journal.move(f'{path}.journal', path)
+        return True
+
+
+    def detach_journal(self):
+        """
+        Stops recording changes, e.g. for reports which should leave the
+        base file as it is. The journal file itself is kept.
+        """
+        self.journal = None
+
+
+    def _journal_append(self, op: str, **payload):
+        """
+        Records a change, asking for a compaction when the journal is too big.
+
+        Args:
+            op (str): Operation name
+            **payload: Operation arguments
+        """
+        if self.journal is None:
+            return
+        self.journal.append(op, **payload)
+        if self.journal.needs_compaction():
+            self.listener.journal_full()
+
+
+    def save_to_file(self, file) -> bool:
+        """
+        Saves the data, as a native checkpoint when file ends with '.arrow'
+        or '.parquet', otherwise as CSV.
+
+        Args:
+            file (str): File path
+
+        Returns:
+            bool: True when success
+        """
+        return save_checkpoint(self._data, file, separator=self.separator_defined)
+
+#------------------------ QUERIES TO BE ADDED
+    @versioned_query
+    def get_transactions_by(self, refresh_schedule: str):
+        return self.rollup.table(truncate_period(refresh_schedule), self._data)\
+            .select('Data', 'Descrição', 'Categoria', 'Valor')\
+            .sort('Data')\
+            .to_dict()
+            # .filter(pl.col(self.column_name_maps['cat']).str.contains('Pix'))\
+            #.dt.truncate('1mo')
+
+
+    @versioned_query
+    def get_top_significant_expenses_by_category(self):
+        return self._expenses_by_category_plan(self._data.lazy())\
+            .collect()\
+            .to_dict(as_series=False)
+
+
+    @versioned_query
+    def get_distribution_by_bank(self):
+        return self._distribution_by_bank_plan(self._data.lazy())\
+            .collect()\
+            .to_dict(as_series=False)
+
+
+    def _expenses_by_category_plan(self, ledger: pl.LazyFrame) -> pl.LazyFrame:
+        return ledger\
+            .group_by('Categoria')\
+            .agg(pl.col('Valor').abs().sum())\
+            .sort(by=pl.col('Valor'),descending=True)\
+            .select('Categoria', 'Valor')
+
+
+    def _distribution_by_bank_plan(self, ledger: pl.LazyFrame) -> pl.LazyFrame:
+        # Current balance plus what was invested, by bank, in a single group by
+        return ledger\
+            .group_by('Banco/Corretora')\
+            .agg(
+                (pl.col('Saldo').last().abs()
+                 + pl.col('Valor').filter(pl.col('Categoria') == 'Aplicacao').sum().abs())
+                .alias('Valor'))\
+            .sort(by=pl.col('Valor'),descending=True)
+
+
+    @versioned_query
+    def get_total_amount_by(self, refresh_schedule: str ):
+        return self.rollup.balances(truncate_period(refresh_schedule), self._data)\
+            .to_dict()
+
+    def dashboard_snapshot(self, refresh_schedule: str) -> DashboardSnapshot:
+        """
+        Freezes the dashboard queries at the current data version. Only the
+        rollup tables are brought up to date here, the ledger scans are left
+        to DashboardSnapshot.collect, which may run on a worker thread.
+
+        Args:
+            refresh_schedule (str): daily, weekly, monthly, quarterly or yearly
+
+        Returns:
+            DashboardSnapshot: Dashboard plans, or the cached result
+        """
+        key = ('get_dashboard', self.data_version, (refresh_schedule,), ())
+        found, result = self.query_cache.get(key)
+        if found:
+            return DashboardSnapshot(key, self.query_cache, result=result)
+        every = truncate_period(refresh_schedule)
+        ledger = self._data.lazy()
+        return DashboardSnapshot(key, self.query_cache, plans=[
+            self.rollup.table(every, self._data).lazy()\
+                .select('Data', 'Descrição', 'Categoria', 'Valor')\
+                .sort('Data'),
+            self._expenses_by_category_plan(ledger),
+            self._distribution_by_bank_plan(ledger),
+            self.rollup.balances(every, self._data).lazy()
+        ])
+
+
+    def get_dashboard(self, refresh_schedule: str) -> dict:
+        """
+        Runs every dashboard query at once, on the calling thread.
+
+        Args:
+            refresh_schedule (str): daily, weekly, monthly, quarterly or yearly
+
+        Returns:
+            dict: ChartBuilder.refresh_plots keyword arguments
+        """
+        return self.dashboard_snapshot(refresh_schedule).collect()
+
+    # def get_current_amount(self):
+    #     return self._data.select('Data', 'Saldo').to_dict()
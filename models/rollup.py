@@ -0,0 +1,158 @@
+import polars as pl
+
+# Every granularity the dashboard can be refreshed by
+PERIODS = ('1d', '1w', '1mo', '1q', '1y')
+ROLLUP_KEY = ('Data', 'Descrição', 'Categoria')
+# Every fold appends a chunk, they are merged back past this many
+MAX_ROLLUP_CHUNKS = 64
+
+
+def truncate_period(refresh_schedule: str) -> str:
+    """
+    Maps a refresh schedule to its polars truncate period.
+
+    Args:
+        refresh_schedule (str): daily, weekly, monthly, quarterly or yearly
+
+    Returns:
+        str: Period string, e.g. '1mo'
+    """
+    match refresh_schedule:
+        case 'weekly':
+            return '1w'
+        case 'monthly':
+            return '1mo'
+        case 'quarterly':
+            return '1q'
+        case 'yearly':
+            return '1y'
+        case 'daily' | _:
+            return '1d'
+
+
+class PeriodRollup():
+    def __init__(self) -> None:
+        """
+        Materialized sums by (period, Descrição, Categoria), for every period
+        in PERIODS. Each table is built from the ledger the first time it is
+        read. From then on, changes are aggregated on their own and queued,
+        then folded into the table the next time it is read, so the ledger
+        itself is never aggregated again.
+        """
+        self._tables = {every: None for every in PERIODS}
+        self._pending = {every: [] for every in PERIODS}
+
+
+    def aggregate(self, rows: pl.DataFrame, every: str, sign: int = 1) -> pl.DataFrame:
+        """
+        Sums rows by period, description and category.
+
+        Args:
+            rows (pl.DataFrame): Rows in the FinanceSchema
+            every (str): Period, e.g. '1mo'
+            sign (int, optional): -1 to aggregate rows being removed. Defaults to 1.
+
+        Returns:
+            pl.DataFrame: Data, Descrição, Categoria, Valor and Registros (row count)
+        """
+        return rows\
+            .group_by(pl.col('Data').dt.truncate(every), 'Descrição', 'Categoria')\
+            .agg(
+                pl.col('Valor').sum().mul(sign),
+                pl.len().cast(pl.Int64).mul(sign).alias('Registros'))
+
+
+    def add(self, rows: pl.DataFrame) -> None:
+        """
+        Queues rows inserted into the ledger.
+
+        Args:
+            rows (pl.DataFrame): Inserted rows
+        """
+        if rows.is_empty():
+            return
+        for every in PERIODS:
+            if self._tables[every] is not None:
+                self._pending[every].append(self.aggregate(rows, every))
+
+
+    def remove(self, rows: pl.DataFrame) -> None:
+        """
+        Queues rows removed from the ledger.
+
+        Args:
+            rows (pl.DataFrame): Removed rows
+        """
+        if rows.is_empty():
+            return
+        for every in PERIODS:
+            if self._tables[every] is not None:
+                self._pending[every].append(self.aggregate(rows, every, sign=-1))
+
+
+    def table(self, every: str, data: pl.DataFrame) -> pl.DataFrame:
+        """
+        Retrieves the sums of a period, folding queued changes first, see
+        _fold.
+
+        Args:
+            every (str): Period, e.g. '1mo'
+            data (pl.DataFrame): Whole ledger, only aggregated on the first read
+
+        Returns:
+            pl.DataFrame: Data, Descrição, Categoria, Valor and Registros
+        """
+        if self._tables[every] is None:
+            self._tables[every] = self.aggregate(data, every)
+        elif self._pending[every]:
+            self._tables[every] = self._fold(self._tables[every], self._pending[every])
+            self._pending[every] = []
+        return self._tables[every]
+
+
+    def _fold(self, table: pl.DataFrame, pending: list[pl.DataFrame]) -> pl.DataFrame:
+        """
+        Folds queued changes into a rollup table. The changes are summed on
+        their own, then only the rows of the periods they touch are taken
+        out of the table, merged with them and put back. Buckets left with
+        no rows are dropped.
+
+        Args:
+            table (pl.DataFrame): Rollup table
+            pending (list[pl.DataFrame]): Queued changes, see aggregate
+
+        Returns:
+            pl.DataFrame: Updated rollup table
+        """
+        deltas = pl.concat(pending)
+        periods = deltas.get_column('Data')
+        # A cheap date check narrows the table down to the touched periods
+        touched = pl.col('Data').is_in(periods.drop_nulls().unique()).fill_null(periods.null_count() > 0)
+        table = table.with_columns(touched.alias('_touched'))
+        merged = pl.concat([table.filter('_touched').drop('_touched'), deltas])\
+            .group_by(ROLLUP_KEY)\
+            .agg(pl.col('Valor').sum(), pl.col('Registros').sum())\
+            .filter(pl.col('Registros') > 0)
+        table = pl.concat([table.filter(~pl.col('_touched')).drop('_touched'), merged])
+        return table.rechunk() if table.n_chunks() > MAX_ROLLUP_CHUNKS else table
+
+
+    def balances(self, every: str, data: pl.DataFrame) -> pl.DataFrame:
+        """
+        Retrieves the balance at the end of each period. The sorted ledger is
+        binary searched at every period boundary, instead of aggregated.
+
+        Args:
+            every (str): Period, e.g. '1mo'
+            data (pl.DataFrame): Whole ledger, sorted by Data, with its Saldo
+
+        Returns:
+            pl.DataFrame: Data and 'Saldo período'
+        """
+        periods = self.table(every, data).select(pl.col('Data').drop_nulls().unique().sort())
+        dates = data.get_column('Data')
+        nulls = dates.null_count()
+        last_rows = dates.slice(nulls).search_sorted(
+            periods.get_column('Data').dt.offset_by(every), side='left') + nulls - 1
+        return periods.with_columns(
+            data.get_column('Saldo').gather(last_rows).alias('Saldo período'))
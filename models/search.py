@@ -0,0 +1,159 @@
+import bisect
+import re
+import unicodedata
+import polars as pl
+
+# Ledger columns searched by text
+SEARCH_COLUMNS = ('Descrição', 'Categoria')
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    Folds case and accents away, e.g. "Aplicação" -> "aplicacao".
+
+    Args:
+        text (str): Text to be normalized
+
+    Returns:
+        str: Normalized text
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Splits a text into normalized words.
+
+    Args:
+        text (str): Text to be split
+
+    Returns:
+        list[str]: Normalized words
+    """
+    return TOKEN_PATTERN.findall(normalize_text(text))
+
+
+class SearchIndex():
+    def __init__(self) -> None:
+        """
+        Inverted index from words to the distinct Descrição/Categoria values
+        holding them. Ledgers repeat the same few thousand texts over and
+        over, so only distinct values are tokenized, and each one is counted,
+        to know when the last row holding it is gone.
+        The words are also kept sorted, so prefixes are found by bisection.
+        The index is built from the ledger by build, on startup, or else on
+        the first search, so loading does not pay for it, and kept up to
+        date from then on.
+        """
+        # Distinct value -> how many ledger cells hold it, None until first needed
+        self._counts = None
+        # Word -> distinct values holding it
+        self._postings = {}
+        self._tokens = []
+
+
+    def build(self, data: pl.DataFrame) -> None:
+        """
+        Indexes the ledger rows, unless they were indexed already.
+
+        Args:
+            data (pl.DataFrame): Current ledger
+        """
+        if self._counts is None:
+            self._counts = {}
+            self.add(data)
+
+
+    def _value_counts(self, rows: pl.DataFrame) -> dict:
+        """
+        Counts the distinct texts of rows, over every searched column.
+
+        Args:
+            rows (pl.DataFrame): Ledger rows
+
+        Returns:
+            dict: Text -> count
+        """
+        texts = pl.concat([rows.get_column(column) for column in SEARCH_COLUMNS])\
+            .drop_nulls()\
+            .value_counts()
+        return dict(texts.iter_rows())
+
+
+    def add(self, rows: pl.DataFrame) -> None:
+        """
+        Indexes rows inserted into the ledger.
+
+        Args:
+            rows (pl.DataFrame): Inserted rows
+        """
+        if self._counts is None or rows.is_empty():
+            return
+        for value, count in self._value_counts(rows).items():
+            if value in self._counts:
+                self._counts[value] += count
+                continue
+            self._counts[value] = count
+            for token in set(tokenize(value)):
+                if token not in self._postings:
+                    self._postings[token] = set()
+                    bisect.insort(self._tokens, token)
+                self._postings[token].add(value)
+
+
+    def remove(self, rows: pl.DataFrame) -> None:
+        """
+        Unindexes rows removed from the ledger.
+
+        Args:
+            rows (pl.DataFrame): Removed rows
+        """
+        if self._counts is None or rows.is_empty():
+            return
+        for value, count in self._value_counts(rows).items():
+            self._counts[value] -= count
+            if self._counts[value] > 0:
+                continue
+            del self._counts[value]
+            for token in set(tokenize(value)):
+                self._postings[token].discard(value)
+                if not self._postings[token]:
+                    del self._postings[token]
+                    del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+
+    def _prefixed(self, prefix: str) -> set[str]:
+        """
+        Distinct values holding any word which starts with prefix.
+
+        Args:
+            prefix (str): Normalized word prefix
+
+        Returns:
+            set[str]: Matching values
+        """
+        values = set()
+        position = bisect.bisect_left(self._tokens, prefix)
+        while position < len(self._tokens) and self._tokens[position].startswith(prefix):
+            values |= self._postings[self._tokens[position]]
+            position += 1
+        return values
+
+
+    def search(self, query: str, data: pl.DataFrame) -> list[set[str]]:
+        """
+        Finds the values matching each word of a query, as a prefix,
+        ignoring case and accents. A row matches the query when every word
+        is matched by any of its searched columns.
+
+        Args:
+            query (str): Text typed by the user
+            data (pl.DataFrame): Current ledger, read only to build the index
+
+        Returns:
+            list[set[str]]: Distinct Descrição/Categoria values, one set per word
+        """
+        self.build(data)
+        return [self._prefixed(prefix) for prefix in set(tokenize(query))]
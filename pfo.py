@@ -1,22 +1,29 @@
+from startup_lib.timer import StartupTimer
+# Started before the imports, which are startup phases too
+startup_timer = StartupTimer()
 import os
 import sys
+import glob
 from PyQt6.QtGui import QAction, QIcon, QColor
 from PyQt6.QtWidgets import (QMainWindow, QApplication, QTableView,
                              QPushButton, QFileDialog, QHeaderView, QTabWidget,
                              QWidget, QVBoxLayout, QHBoxLayout, QMessageBox,
-                             QSizePolicy, QInputDialog, QColorDialog)
-from PyQt6.QtWebEngineWidgets import QWebEngineView
-from PyQt6.QtCore import Qt, QSize
+                             QSizePolicy, QInputDialog, QColorDialog, QLineEdit)
+from PyQt6.QtCore import Qt, QSize, QTimer, QThreadPool
+startup_timer.mark('import PyQt6')
 import polars as pl
-import plotly.graph_objects as go
 from chart_lib.functions import p_obj
-from chart_lib.generate_chart import ChartBuilder
+from chart_lib.downsample import points_for_width
 import datetime
 from dialogs.addnewregistry import AddNewRegistry
 import dotenv
 from models.finance import FinanceModel
-from preprocess_lib.csv import pre_process_csv
+from preprocess_lib.checkpoint import detect_checkpoint, csv_checkpoint_path, newest_load_path
+from preprocess_lib.csv import pre_process_csv_batch
 from qt_material import apply_stylesheet
+startup_timer.mark('import polars, models')
+# WebEngine is imported right before the ledger loads, plotly by
+# init_dashboard, once the window is up
 
 dotenv_file = dotenv.find_dotenv()
 dotenv.load_dotenv(dotenv_file)
@@ -27,6 +34,14 @@ extra = {
     'warning': '#ffc107',
     'success': '#17a2b8',
 }
+# Change bursts within this window are drawn once, by a single refresh
+REFRESH_DEBOUNCE_MS = 150
+# Room around the text of table cells, in pixels
+CELL_PADDING = (24, 8)
+# Checkpoints written by journal compactions, replaced by the next save
+COMPACTION_PREFIX = 'compaction'
+# Same dashboard layout as pfo_report.py
+CHART_GRID = (3, 4)
 
 class MainWindow(QMainWindow):
 
@@ -34,8 +49,17 @@ class MainWindow(QMainWindow):
         super().__init__()
 
         self.setWindowTitle("PFO - Personal Finance Organizer")
-        env_vars = self.load_set_envs()
-        self.model = FinanceModel(env_vars['INITIAL_LOAD_PATH'], env_vars['DEFAULT_BANK'])
+        self.env_vars = self.load_set_envs()
+        startup_timer.mark('load envs')
+        # Chromium starts and loads the chart page in its own process while
+        # the ledger loads, only plotly waits for the window to be up
+        from chart_lib.chart_view import ChartView
+        self.browser = ChartView(self)
+        startup_timer.mark('import WebEngine, chart page')
+        # A CSV file is loaded from its checkpoint, while it is up to date
+        self.load_path = newest_load_path(self.env_vars['INITIAL_LOAD_PATH'])
+        self.model = FinanceModel(self.load_path, self.env_vars['DEFAULT_BANK'])
+        startup_timer.mark('load ledger')
 
         menu = self.menuBar()
         file_menu = menu.addMenu("Arquivo")
@@ -45,17 +69,22 @@ class MainWindow(QMainWindow):
         save_file.triggered.connect(self.save_file)
         save_file.setCheckable(True)
         # Carregar menu
-        load_file = QAction(QIcon("assets\icons\in.png"), "Carregar+ arquivo", self)
-        load_file.triggered.connect(self.loadplus_file)
+        load_file = QAction(QIcon("assets\icons\in.png"), "Carregar+ arquivos", self)
+        load_file.triggered.connect(self.loadplus_files)
         load_file.setCheckable(True)
         # Restaurar menu
         restore_file = QAction(QIcon("assets\icons\in.png"), "Restaurar dados", self)
         restore_file.triggered.connect(self.restore_file)
         restore_file.setCheckable(True)
 
+        # Recategorizar menu
+        recategorize = QAction(QIcon("assets\icons\in.png"), "Recategorizar dados", self)
+        recategorize.triggered.connect(self.recategorize)
+
         file_menu.addAction(save_file)
         file_menu.addAction(load_file)
         file_menu.addAction(restore_file)
+        file_menu.addAction(recategorize)
 
         self.current_refresh = 'daily'
         # ------- Add 'Analises' TAB
@@ -98,21 +127,34 @@ class MainWindow(QMainWindow):
         self.chart_menu.setLayout(menu_vlayout)
         hlayout_analysis.addWidget(self.chart_menu)
 
-        # Chart
-        self.browser = QWebEngineView(self)
+        # Chart, drawn once init_dashboard builds the first figure
         # qsize_browser = QSizePolicy()
         # qsize_browser.setHorizontalStretch(4)
         # self.browser.setSizePolicy(qsize_browser)
+        self.chart_model = None
+        self.browser.xRangeChanged.connect(self.zoom_charts)
         hlayout_analysis.addWidget(self.browser)
 
-        self.chart_model = ChartBuilder(
-            grid=(3,4),
-            refresh=self.current_refresh
-        )
-        self.chart_model.add_bank_color(env_vars['DEFAULT_BANK'], env_vars['DEFAULT_BANK_COLOR'])
-        self.browser.setHtml(self.chart_model.get_figure().to_html(include_plotlyjs='cdn'))
-        self.update_charts()
-        self.model.layoutChanged.connect(self.update_charts)
+        # Charts are refreshed in the background, one refresh at a time. Each
+        # refresh builds on its own copy of the ChartBuilder, which replaces
+        # the one on screen once shown
+        self.refresh_pool = QThreadPool(self)
+        self.refresh_pool.setMaxThreadCount(1)
+        self.refresh_generation = 0
+        self.refresh_worker = None
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(REFRESH_DEBOUNCE_MS)
+        self.refresh_timer.timeout.connect(self.start_chart_refresh)
+        self.model.dataVersionChanged.connect(self.update_charts)
+        # Checkpoint written by the last journal compaction, replaced by the
+        # next one, and older ones which could not be removed yet
+        self.compacted_checkpoint = None
+        self.stale_checkpoints = []
+        self.model.journalFull.connect(self.compact_journal)
+        # Display columns left to be cached again, see warm_display_cache
+        self.warm_columns = []
+        self.model.modelReset.connect(self.warm_display_cache)
 
         analysis = QWidget()
         analysis.setLayout(hlayout_analysis)
@@ -121,8 +163,14 @@ class MainWindow(QMainWindow):
         # ------- Add 'Extrato' TAB
         vlayout = QVBoxLayout()
         #--------------------------
+        #----------search----------
         #----------table-----------
         #--add-------|-----remove--
+        self.search_box = QLineEdit(self)
+        self.search_box.setPlaceholderText('Buscar por descrição ou categoria...')
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.search_table)
+        vlayout.addWidget(self.search_box)
         self.table = QTableView()
         # self.table.setFixedWidth(800)
         # To resize table header given its contents
@@ -134,8 +182,15 @@ class MainWindow(QMainWindow):
         # TODO: Adjust the column size correctly!!!
         self.table.setModel(self.model)
         # print(self.model.data())
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode(3))
-        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode(3))
+        # Sized from a sample of rows, since ResizeToContents reads every row
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(
+            self.table.fontMetrics().height() + CELL_PADDING[1])
+        self.connect_table_sizing()
+        # Sorted by the model itself, starting in the ledger order
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.table.setSortingEnabled(True)
         vlayout.addWidget(self.table)
 
         hlayout = QHBoxLayout()
@@ -160,6 +215,87 @@ class MainWindow(QMainWindow):
         self.setMinimumSize(QSize(1000, 600))
         self.showMaximized()
         self.setCentralWidget(tabs)
+        startup_timer.mark('build window')
+        # Runs on the first event loop turn, once the window is shown
+        self.first_dashboard_shown = False
+        QTimer.singleShot(0, self.window_ready)
+
+
+    def window_ready(self):
+        startup_timer.mark('window interactive')
+        print(startup_timer.report('Janela interativa:'))
+        # One stage per event loop turn, so the window keeps responding
+        # between them
+        self.startup_stages = [self.init_dashboard, self.checkpoint_initial_csv,
+                               self.remove_stale_checkpoints] + \
+            [self.warm_display_column(column) for column in self.model.ledger.cached_display_columns()] + \
+            [self.build_search_index, self.build_duplicate_index]
+        QTimer.singleShot(0, self.run_startup_stage)
+
+
+    def run_startup_stage(self):
+        if not self.startup_stages:
+            startup_timer.mark('startup stages')
+            return
+        self.startup_stages.pop(0)()
+        QTimer.singleShot(0, self.run_startup_stage)
+
+
+    def init_dashboard(self):
+        # plotly is the heaviest import, it waits for the window to be up,
+        # while the chart page is already loading
+        from chart_lib.generate_chart import ChartBuilder
+        startup_timer.mark('import plotly')
+        self.chart_model = ChartBuilder(
+            grid=CHART_GRID,
+            refresh=self.current_refresh
+        )
+        self.chart_model.add_bank_color(self.env_vars['DEFAULT_BANK'], self.env_vars['DEFAULT_BANK_COLOR'])
+        startup_timer.mark('chart builder')
+        self.update_charts()
+
+
+    def checkpoint_initial_csv(self):
+        # CSV files are parsed on every launch, a checkpoint loads at once.
+        # It is kept next to the CSV, which stays the configured file.
+        if not detect_checkpoint(self.load_path):
+            self.model.ledger.checkpoint_base(csv_checkpoint_path(self.load_path))
+            startup_timer.mark('initial checkpoint')
+
+
+    def warm_display_column(self, column):
+        # The table formats cells one by one until its columns are cached
+        def warm():
+            self.model.ledger.display_column(column)
+        return warm
+
+
+    def build_search_index(self):
+        # The first search would tokenize the whole ledger while typing
+        self.model.ledger.search_index.build(self.model.ledger.data)
+
+
+    def build_duplicate_index(self):
+        # Imports check every row against the ledger counts, they are built
+        # before the first import instead of during it
+        self.model.ledger.duplicates.build(self.model.ledger.data)
+
+
+    def warm_display_cache(self):
+        # Resets (bulk imports, recategorizing, restoring) drop the cached
+        # columns, they are cached again one per event loop turn
+        scheduled = bool(self.warm_columns)
+        self.warm_columns = self.model.ledger.cached_display_columns()
+        if not scheduled:
+            QTimer.singleShot(0, self.warm_next_column)
+
+
+    def warm_next_column(self):
+        if not self.warm_columns:
+            return
+        self.warm_display_column(self.warm_columns.pop(0))()
+        if self.warm_columns:
+            QTimer.singleShot(0, self.warm_next_column)
 
 
     def load_set_envs(self):
@@ -170,7 +306,7 @@ class MainWindow(QMainWindow):
             dlg.setWindowTitle("Tem algo errado 😅 !")
             dlg.setText("Por favor, selecione um arquivo a ser carregado inicialmente!")
             dlg.exec()
-            return_dict['INITIAL_LOAD_PATH'], _ = QFileDialog.getOpenFileName(self, 'Open first CSV', '', filter='Arquivos CSV (*.csv)')
+            return_dict['INITIAL_LOAD_PATH'], _ = QFileDialog.getOpenFileName(self, 'Open first CSV', '', filter='Arquivos CSV ou checkpoints (*.csv *.arrow *.parquet)')
             dotenv.set_key(dotenv_file, 'INITIAL_LOAD_PATH', return_dict['INITIAL_LOAD_PATH'])
         if not return_dict.get('DEFAULT_BANK'):
             dlg_success = False
@@ -183,7 +319,6 @@ class MainWindow(QMainWindow):
             while not color.isValid():
                 color = QColorDialog.getColor(parent=self, title=f"Selecione a cor que representa o banco {return_dict['DEFAULT_BANK']} para você")
             return_dict['DEFAULT_BANK_COLOR'] = 'rgb' + str(color.getRgb())
-            print(color, color.getRgb)
             dotenv.set_key(dotenv_file, 'DEFAULT_BANK_COLOR', return_dict['DEFAULT_BANK_COLOR'])
 
         return return_dict
@@ -201,60 +336,209 @@ class MainWindow(QMainWindow):
                 f.write(f'key="{value}"')
 
 
-    def save_file(self):
-        filename = f'csv_files/checkpoint_{datetime.datetime.now().strftime("%d%m%Y%H%M%S")}.csv'
-        self.model.save_to_file(filename)
-        self.set_initial_path_env(filename)
+    def set_initial_path_env(self, filename):
+        dotenv.set_key(dotenv_file, 'INITIAL_LOAD_PATH', filename)
+
 
+    def save_file(self):
+        return self.write_checkpoint('checkpoint')
 
 
-    def loadplus_file(self):
-        filename, _ = QFileDialog.getOpenFileName(self, 'Open CSV', '', filter='Arquivos CSV (*.csv)')
-        if filename:
-            while not dlg_success:
-                bank_name, dlg_success = QInputDialog.getText(self, "Banco", "Por favor, informe o banco/corretora das operações:")
-            self.model.add_rows(pre_process_csv(filename, bank=bank_name))
+    def write_checkpoint(self, prefix):
+        previous_compaction = self.compacted_checkpoint
+        os.makedirs('csv_files', exist_ok=True)
+        filename = f'csv_files/{prefix}_{datetime.datetime.now().strftime("%d%m%Y%H%M%S%f")}.arrow'
+        self.model.ledger.save_to_file(filename)
+        self.set_initial_path_env(filename)
+        # Changes are part of the new checkpoint now
+        self.model.ledger.attach_journal(filename)
+        # Checkpoints written by compactions are replaced by the next save,
+        # so a long session does not pile up full copies of the ledger.
+        # Checkpoints saved by the user are kept.
+        self.compacted_checkpoint = None
+        if previous_compaction is not None and previous_compaction != filename:
+            self.stale_checkpoints.append(previous_compaction)
+        self.stale_checkpoints = [path for path in self.stale_checkpoints
+                                  if not self.remove_checkpoint(path)]
+        return filename
+
+
+    def compact_journal(self):
+        self.compacted_checkpoint = self.write_checkpoint(COMPACTION_PREFIX)
+
+
+    def remove_stale_checkpoints(self):
+        # Each session ends on its last compaction checkpoint. The loaded one
+        # is replaced by the next save, older ones are not needed anymore,
+        # unless they still have changes journaled on top of them.
+        loaded = os.path.abspath(self.load_path)
+        for path in glob.glob(os.path.join('csv_files', f'{COMPACTION_PREFIX}_*.arrow')):
+            if os.path.abspath(path) == loaded:
+                self.compacted_checkpoint = path
+            elif not os.path.exists(f'{path}.journal'):
+                self.stale_checkpoints.append(path)
+        self.stale_checkpoints = [path for path in self.stale_checkpoints
+                                  if not self.remove_checkpoint(path)]
+
+
+    def remove_checkpoint(self, path):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            return True
+        except OSError:
+            # Windows keeps files open while they are memory-mapped, it is
+            # tried again on the next compaction
+            return False
+
+
+    def loadplus_files(self):
+        filenames, _ = QFileDialog.getOpenFileNames(self, 'Open CSV', '', filter='Arquivos CSV (*.csv)')
+        if not filenames:
+            return
+        # The bank is asked once for the whole batch, rows of other banks
+        # are fixed afterwards on the Banco/Corretora column of the table
+        selected = os.path.basename(filenames[0]) if len(filenames) == 1 else f'{len(filenames)} arquivos'
+        bank_name, dlg_success = QInputDialog.getText(
+            self, "Banco",
+            f"Por favor, informe o banco/corretora das operações de {selected}:",
+            text=self.model.ledger.default_bank)
+        if not dlg_success:
+            return
+        files = [(filename, bank_name) for filename in filenames]
+        # Statements are kept apart, since they may overlap each other
+        statements, timings, errors = pre_process_csv_batch(files, concat=False)
+        skipped = self.model.ledger.add_rows(statements)
+        report = [f'{os.path.basename(path)}: {seconds:.2f}s' for path, seconds in timings.items()]
+        report += [f'{os.path.basename(path)}: erro! {error}' for path, error in errors.items()]
+        report.append(f'{skipped} registros duplicados ignorados.')
+        if len(filenames) > 1:
+            report.append(f'Todos importados como {bank_name}, corrija o Banco/Corretora na tabela se preciso.')
+        dlg = QMessageBox(self)
+        dlg.setWindowTitle("Arquivos carregados")
+        dlg.setText('\n'.join(report))
+        dlg.exec()
 
 
     def restore_file(self):
-        filename, _ = QFileDialog.getOpenFileName(self, 'Open CSV', '', filter='Arquivos CSV (*.csv)')
+        filename, _ = QFileDialog.getOpenFileName(self, 'Open checkpoint', '', filter='Checkpoints (*.arrow *.parquet *.csv)')
         if filename:
-            self.model = FinanceModel(filename)
+            self.model = FinanceModel(filename, self.model.ledger.default_bank)
             self.table.setModel(self.model)
+            self.connect_table_sizing()
+            self.table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+            self.search_box.clear()
+            self.model.dataVersionChanged.connect(self.update_charts)
+            self.model.journalFull.connect(self.compact_journal)
+            self.compacted_checkpoint = None
+            self.model.modelReset.connect(self.warm_display_cache)
+            self.warm_display_cache()
+            QTimer.singleShot(0, self.build_search_index)
+            QTimer.singleShot(0, self.build_duplicate_index)
+            self.update_charts()
+
+
+    def connect_table_sizing(self):
+        self.model.modelReset.connect(self.resize_table_columns)
+        self.model.rowsInserted.connect(self.resize_table_columns)
+        self.resize_table_columns()
+
+
+    def resize_table_columns(self):
+        # Widths come from the head, the tail and the longest values only
+        metrics = self.table.fontMetrics()
+        header = self.table.horizontalHeader()
+        header_metrics = header.fontMetrics()
+        for column in range(self.model.columnCount()):
+            title = self.model.headerData(column, Qt.Orientation.Horizontal, Qt.ItemDataRole.DisplayRole)
+            width = max([header_metrics.horizontalAdvance(title)] +
+                        [metrics.horizontalAdvance(value) for value in self.model.ledger.column_sample(column)])
+            header.resizeSection(column, width + CELL_PADDING[0])
+
+
+    def recategorize(self):
+        try:
+            message = f'{self.model.ledger.recategorize()} registros mudaram de categoria.'
+        except Exception as e:
+            message = f'Regras de categorização com erro! {e}'
+        dlg = QMessageBox(self)
+        dlg.setWindowTitle("Recategorização")
+        dlg.setText(message)
+        dlg.exec()
+
+
+    def search_table(self, text):
+        self.model.set_filter('text', text)
 
 
     def update_charts(self):
-        print(self.model._data)
-        bar_values = self.model.get_transactions_by(refresh_schedule=self.current_refresh)
-        rank_categories = self.model.get_top_significant_expenses_by_category()
-        rank_bank = self.model.get_distribution_by_bank()
-        scatter_values = self.model.get_total_amount_by(refresh_schedule=self.current_refresh)
-        # p_obj(bar_values)
-        # p_obj(scatter_values)
-        self.chart_model.set_schedule(self.current_refresh)
-        self.chart_model.refresh_plots(
-            bar_values=bar_values,
-            rank_categories=rank_categories,
-            rank_bank=rank_bank,
-            scatter_values=scatter_values
-        )
-        self.browser.setHtml(self.chart_model.get_figure().to_html(include_plotlyjs='cdn'))
+        # (Re)starts the debounce, the refresh itself runs once it settles
+        self.refresh_timer.start()
+
+
+    def start_chart_refresh(self):
+        if self.chart_model is None:
+            # Refreshed by init_dashboard, once the charts exist
+            return
+        from chart_lib.refresh_worker import ChartRefreshWorker
+        self.refresh_generation += 1
+        # Frozen on the GUI thread, so later changes don't reach the worker
+        snapshot = self.model.ledger.dashboard_snapshot(refresh_schedule=self.current_refresh)
+        self.refresh_worker = ChartRefreshWorker(
+            self.refresh_generation,
+            self.is_current_refresh,
+            snapshot,
+            self.chart_model.copy(),
+            self.current_refresh,
+            points_for_width(self.browser.width()))
+        self.refresh_worker.signals.finished.connect(self.show_chart_refresh)
+        self.refresh_worker.signals.failed.connect(self.chart_refresh_failed)
+        self.refresh_pool.start(self.refresh_worker)
+
+
+    def is_current_refresh(self, generation):
+        return generation == self.refresh_generation
+
+
+    def show_chart_refresh(self, generation, figure_json, chart_model):
+        # A newer refresh is on its way, drop this one
+        if self.is_current_refresh(generation):
+            self.chart_model = chart_model
+            self.browser.show_json(figure_json)
+            if not self.first_dashboard_shown:
+                self.first_dashboard_shown = True
+                startup_timer.mark('first dashboard')
+                print(startup_timer.report('Dashboard pronto:'))
+                if self.env_vars.get('STARTUP_REPORT_PATH'):
+                    startup_timer.save(self.env_vars['STARTUP_REPORT_PATH'])
+
+
+    def chart_refresh_failed(self, generation, error):
+        print(f'Chart refresh {generation} failed: {error}')
+
+
+    def zoom_charts(self, x_range):
+        # Draws the balance again, at full resolution within the visible range
+        self.browser.restyle_trace('saldo', self.chart_model.scatter_window(
+            x_range, points_for_width(self.browser.width())))
 
 
     def add(self, s):
         dlg = AddNewRegistry()
-        print(self.model.get_transactions_by(refresh_schedule=self.current_refresh))
         if dlg.exec():
-            self.model.add_registry(dlg.get_filled_data())
+            self.model.ledger.add_registry(dlg.get_filled_data())
 
     def remove(self):
-        for qitem in self.table.selectionModel().selectedRows():
-            self.model.remove_registry(qitem)
+        self.model.remove_registries(
+            {qitem.row() for qitem in self.table.selectionModel().selectedRows()})
 
 
+# QtWebEngineWidgets is only imported once the QApplication exists
+QApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
 app=QApplication(sys.argv)
 window=MainWindow()
 # setup stylesheet
 apply_stylesheet(app, theme='dark_red.xml', extra=extra)
+startup_timer.mark('stylesheet')
 window.show()
 app.exec()
\ No newline at end of file
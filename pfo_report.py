@@ -0,0 +1,149 @@
+"""
+Headless PFO: ingests statements into a ledger, runs the dashboard
+aggregations and exports them, along with the dashboard figure, without Qt.
+
+e.g.:
+    python pfo_report.py --ledger csv_files/checkpoint.arrow \\
+        --statement extrato_maio.csv Inter --statement fatura.csv Nubank \\
+        --refresh monthly --figure dashboard.html --aggregates relatorio
+"""
+import argparse
+import os
+import sys
+import time
+import dotenv
+import polars as pl
+from models.ledger import Ledger
+from preprocess_lib.csv import pre_process_csv_batch
+
+REFRESH_SCHEDULES = ('daily', 'weekly', 'monthly', 'quarterly', 'yearly')
+AGGREGATE_FORMATS = ('parquet', 'csv')
+# Same dashboard layout as the GUI
+CHART_GRID = (3, 4)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    env_vars = dotenv.dotenv_values(dotenv.find_dotenv())
+    parser = argparse.ArgumentParser(
+        description='PFO sem interface: importa extratos e exporta o dashboard.')
+    parser.add_argument('--ledger', default=env_vars.get('INITIAL_LOAD_PATH'),
+                        help='CSV ou checkpoint (.arrow/.parquet) inicial. Padrão: INITIAL_LOAD_PATH do .env')
+    parser.add_argument('--bank', default=env_vars.get('DEFAULT_BANK') or '',
+                        help='Banco/corretora dos CSVs sem banco informado. Padrão: DEFAULT_BANK do .env')
+    parser.add_argument('--bank-color', default=env_vars.get('DEFAULT_BANK_COLOR'),
+                        help='Cor do banco padrão nos gráficos. Padrão: DEFAULT_BANK_COLOR do .env')
+    parser.add_argument('--statement', action='append', nargs='+', default=[], metavar=('CSV', 'BANCO'),
+                        help='Extrato a ser importado, pode ser repetido')
+    parser.add_argument('--refresh', choices=REFRESH_SCHEDULES, default='daily',
+                        help='Período das agregações. Padrão: daily')
+    parser.add_argument('--figure', help='Exporta o dashboard para um arquivo .html ou .json')
+    parser.add_argument('--aggregates', metavar='PASTA', help='Exporta as agregações do dashboard para uma pasta')
+    parser.add_argument('--format', choices=AGGREGATE_FORMATS, default='parquet',
+                        help='Formato das agregações. Padrão: parquet')
+    parser.add_argument('--save', metavar='ARQUIVO',
+                        help='Salva o ledger, com os extratos importados, em um novo checkpoint')
+    args = parser.parse_args(argv)
+    if not args.ledger:
+        parser.error('Por favor, informe um arquivo a ser carregado inicialmente (--ledger)!')
+    for statement in args.statement:
+        if len(statement) > 2:
+            parser.error(f'--statement recebe um CSV e, opcionalmente, um banco: {statement}')
+    if args.figure and os.path.splitext(args.figure)[1].lower() not in ('.html', '.json'):
+        parser.error('--figure deve terminar em .html ou .json')
+    return args
+
+
+def import_statements(ledger: Ledger, statements: list[list[str]]) -> bool:
+    """
+    Imports statements into the ledger, skipping rows already in it.
+
+    Args:
+        ledger (Ledger): Ledger to import into
+        statements (list[list[str]]): CSV path, optionally followed by a bank
+
+    Returns:
+        bool: True when every statement was imported
+    """
+    files = [(statement[0], statement[1] if len(statement) > 1 else ledger.default_bank)
+             for statement in statements]
+    # Statements are kept apart, since they may overlap each other
+    frames, timings, errors = pre_process_csv_batch(files, concat=False)
+    skipped = ledger.add_rows(frames)
+    for path, seconds in timings.items():
+        print(f'{os.path.basename(path)}: {seconds:.2f}s')
+    for path, error in errors.items():
+        print(f'{os.path.basename(path)}: erro! {error}', file=sys.stderr)
+    print(f'{skipped} registros duplicados ignorados.')
+    return not errors
+
+
+def export_aggregates(dashboard: dict, folder: str, file_format: str):
+    """
+    Writes every dashboard table to a folder, one file per table.
+
+    Args:
+        dashboard (dict): Ledger.get_dashboard result
+        folder (str): Output folder
+        file_format (str): 'parquet' or 'csv'
+    """
+    os.makedirs(folder, exist_ok=True)
+    for name, table in dashboard.items():
+        df = pl.DataFrame(table)
+        path = os.path.join(folder, f'{name}.{file_format}')
+        if file_format == 'csv':
+            df.write_csv(path, separator=';', float_precision=2)
+        else:
+            df.write_parquet(path)
+        print(f'{path}: {df.shape[0]} linhas')
+
+
+def export_figure(dashboard: dict, path: str, refresh: str, bank: str, bank_color: str | None):
+    """
+    Builds the dashboard figure, just like the GUI does, and writes it.
+
+    Args:
+        dashboard (dict): Ledger.get_dashboard result
+        path (str): .html (self-contained) or .json output file
+        refresh (str): daily, weekly, monthly, quarterly or yearly
+        bank (str): Default bank
+        bank_color (str | None): Default bank color, other banks get random ones
+    """
+    # plotly is only needed here, aggregate only runs don't pay for it
+    from chart_lib.generate_chart import ChartBuilder
+    chart_model = ChartBuilder(grid=CHART_GRID, refresh=refresh)
+    if bank_color:
+        chart_model.add_bank_color(bank, bank_color)
+    chart_model.refresh_plots(**dashboard)
+    if path.lower().endswith('.json'):
+        chart_model.get_figure().write_json(path)
+    else:
+        chart_model.get_figure().write_html(path)
+    print(f'{path}: dashboard {refresh}')
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    start = time.perf_counter()
+    ledger = Ledger(args.ledger, args.bank)
+    print(f'{args.ledger}: {ledger.data.shape[0]} registros em {time.perf_counter()-start:.2f}s')
+    # Reports leave the base file as it is, only --save keeps the imports
+    ledger.detach_journal()
+    success = import_statements(ledger, args.statement) if args.statement else True
+    if args.figure or args.aggregates:
+        start = time.perf_counter()
+        dashboard = ledger.get_dashboard(args.refresh)
+        print(f'Agregações em {time.perf_counter()-start:.2f}s')
+        if args.aggregates:
+            export_aggregates(dashboard, args.aggregates, args.format)
+        if args.figure:
+            export_figure(dashboard, args.figure, args.refresh, args.bank, args.bank_color)
+    if args.save:
+        ledger.save_to_file(args.save)
+        # A stale journal of a previous file there must not be replayed on top
+        ledger.attach_journal(args.save)
+        print(f'{args.save}: {ledger.data.shape[0]} registros salvos')
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import json
+import os
+import re
+import polars as pl
+
+# User editable rules, e.g.:
+# [
+#     {"match": "prefix", "pattern": "Pix enviado", "category": "Pix"},
+#     {"match": "keyword", "pattern": "uber", "category": "Transporte"},
+#     {"match": "regex", "pattern": "^(IFOOD|RAPPI)", "category": "Alimentação"}
+# ]
+# Matching ignores case, and the first matching rule wins.
+RULES_FILE = 'category_rules.json'
+MATCH_TYPES = ('prefix', 'keyword', 'regex')
+# Named group of each rule in the combined matcher, followed by its index
+RULE_GROUP = '_regra'
+
+
+class CategoryRules():
+    def __init__(self, rules: list[dict]) -> None:
+        """
+        Rule set which maps descriptions to categories. Every rule is
+        compiled into a single anchored regex, one named group per rule, so
+        descriptions are scanned once and the first matching rule wins.
+        Descriptions repeat a lot, so the regex only ever runs over distinct
+        descriptions, and every result is memoized.
+
+        Args:
+            rules (list[dict]): Rules with 'match' (prefix, keyword or regex),
+                'pattern' and 'category'
+
+        Raises:
+            Exception: Invalid rule
+        """
+        for rule in rules:
+            if rule.get('match') not in MATCH_TYPES:
+                raise Exception(f'Regra inválida: {rule}, "match" deve ser um de {MATCH_TYPES}!')
+            if not rule.get('pattern') or not rule.get('category'):
+                raise Exception(f'Regra inválida: {rule}, "pattern" e "category" são obrigatórios!')
+            if rule['match'] == 'regex':
+                # Rules run on the polars regex engine, which lacks a few
+                # features of re, e.g. look-arounds and backreferences
+                try:
+                    pl.select(pl.lit('').str.contains(rule['pattern']))
+                except pl.exceptions.PolarsError as e:
+                    raise Exception(f'Regra inválida: {rule}, regex não suportada: {e}')
+        self.rules = rules
+        # Description -> category, None when no rule matches it
+        self._memo = {}
+        self._matcher = self._compile()
+        try:
+            pl.select(pl.lit('').str.extract_groups(self._matcher))
+        except pl.exceptions.PolarsError as e:
+            # e.g. the same group name in two regex rules
+            raise Exception(f'Regras inválidas em conjunto: {e}')
+
+
+    def _pattern(self, rule: dict) -> str:
+        """
+        Translates a rule into a regex.
+
+        Args:
+            rule (dict): Rule
+
+        Returns:
+            str: Regex
+        """
+        match rule['match']:
+            case 'prefix':
+                return '^' + re.escape(rule['pattern'])
+            case 'keyword':
+                return re.escape(rule['pattern'])
+            case 'regex' | _:
+                return rule['pattern']
+
+
+    def _compile(self) -> str:
+        """
+        Compiles the rules into one regex. Every alternative is anchored at
+        the start and skips ahead to its own pattern, so all of them match
+        from the same position and the leftmost-first alternation picks the
+        first rule that matches anywhere, not the earliest match.
+
+        Returns:
+            str: Regex, with a RULE_GROUP named group per rule
+        """
+        alternatives = [f'(?P<{RULE_GROUP}{idx}>(?s:.*?)(?:{self._pattern(rule)}))'
+                        for idx, rule in enumerate(self.rules)]
+        return '(?i)^(?:' + '|'.join(alternatives) + ')'
+
+
+    def categorize(self, descriptions: pl.Series) -> pl.Series:
+        """
+        Finds the category of each description.
+
+        Args:
+            descriptions (pl.Series): Descrição values
+
+        Returns:
+            pl.Series: Category of each one, null when no rule matches it
+        """
+        distinct = descriptions.drop_nulls().unique().to_list()
+        unknown = [description for description in distinct if description not in self._memo]
+        if unknown and not self.rules:
+            self._memo.update(dict.fromkeys(unknown))
+        elif unknown:
+            matches = pl.DataFrame({'Descrição': unknown}, schema={'Descrição': pl.String})\
+                .select(pl.col('Descrição').str.extract_groups(self._matcher))\
+                .unnest('Descrição')
+            # At most one rule group is set, the one of the matching rule
+            categories = matches.select(pl.coalesce([
+                pl.when(pl.col(f'{RULE_GROUP}{idx}').is_not_null()).then(pl.lit(rule['category'], dtype=pl.String))
+                for idx, rule in enumerate(self.rules)])).to_series()
+            self._memo.update(zip(unknown, categories.to_list()))
+        return descriptions.replace_strict(
+            distinct, [self._memo[description] for description in distinct],
+            default=None, return_dtype=pl.String)\
+            .alias('Categoria')
+
+
+    def apply(self, df: pl.DataFrame) -> pl.DataFrame:
+        """
+        Categorizes rows, keeping the category they already have whenever
+        no rule matches their description.
+
+        Args:
+            df (pl.DataFrame): Rows with 'Descrição' and 'Categoria'
+
+        Returns:
+            pl.DataFrame: Rows with the new categories
+        """
+        if not self.rules or df.is_empty():
+            return df
+        return df.with_columns(
+            self.categorize(df.get_column('Descrição')).fill_null(df.get_column('Categoria')))
+
+
+    @classmethod
+    def from_file(cls, path: str) -> 'CategoryRules':
+        """
+        Loads rules from a JSON file. A missing file means no rules.
+
+        Args:
+            path (str): JSON file path
+
+        Returns:
+            CategoryRules: Loaded rules
+        """
+        if not os.path.exists(path):
+            return cls([])
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+
+# Rules loaded from RULES_FILE, with its modification time
+_loaded_rules = (None, None)
+
+
+def load_rules(path: str = RULES_FILE) -> CategoryRules:
+    """
+    Rules from the rules file, loaded again only once the file changes,
+    so the memoized categories are reused between imports.
+
+    Args:
+        path (str, optional): JSON file path. Defaults to RULES_FILE.
+
+    Returns:
+        CategoryRules: Current rules
+    """
+    global _loaded_rules
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    key = (path, mtime)
+    if _loaded_rules[0] != key:
+        _loaded_rules = (key, CategoryRules.from_file(path))
+    return _loaded_rules[1]
@@ -0,0 +1,124 @@
+# Native checkpoints, which keep the FinanceSchema types as they are
+import os
+import polars as pl
+from schema.finance import FinanceSchema
+from preprocess_lib.csv import pre_process_csv
+
+ARROW_MAGIC = b'ARROW1'
+PARQUET_MAGIC = b'PAR1'
+
+
+def detect_checkpoint(path: str) -> str | None:
+    """
+    Detects a native checkpoint by its magic bytes, so the extension does
+    not matter.
+
+    Args:
+        path (str): File path
+
+    Returns:
+        str | None: 'ipc', 'parquet' or None when it is not a checkpoint
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(ARROW_MAGIC))
+    if magic == ARROW_MAGIC:
+        return 'ipc'
+    if magic[:len(PARQUET_MAGIC)] == PARQUET_MAGIC:
+        return 'parquet'
+    return None
+
+
+def load_checkpoint(path: str) -> pl.DataFrame:
+    """
+    Loads a native checkpoint. Arrow IPC files are memory-mapped, so no data
+    is copied nor parsed.
+
+    Args:
+        path (str): Checkpoint path
+
+    Raises:
+        Exception: Not a checkpoint
+
+    Returns:
+        pl.DataFrame: DataFrame loaded
+    """
+    match detect_checkpoint(path):
+        case 'ipc':
+            df = pl.read_ipc(path, memory_map=True, rechunk=False)
+        case 'parquet':
+            df = pl.read_parquet(path)
+        case _:
+            raise Exception(f'{path} não é um checkpoint!')
+    return df.select(FinanceSchema().keys())
+
+
+def save_checkpoint(df: pl.DataFrame, path: str, separator: str = ';') -> bool:
+    """
+    Saves data according to the file extension: '.arrow'/'.ipc' as
+    uncompressed Arrow IPC (memory-mappable), '.parquet' as compressed
+    Parquet or anything else as CSV.
+
+    Args:
+        df (pl.DataFrame): Data to be saved
+        path (str): Checkpoint path
+        separator (str, optional): CSV separator. Defaults to ';'.
+
+    Returns:
+        bool: True when success
+    """
+    match os.path.splitext(path)[1].lower():
+        case '.arrow' | '.ipc':
+            df.rechunk().write_ipc(path, compression='uncompressed')
+        case '.parquet':
+            df.write_parquet(path, compression='zstd')
+        case _:
+            df.write_csv(path, separator=separator, float_precision=2)
+    return True
+
+
+def csv_checkpoint_path(path: str) -> str:
+    """
+    Where the checkpoint of a CSV file is kept, next to it.
+
+    Args:
+        path (str): CSV path
+
+    Returns:
+        str: Checkpoint path
+    """
+    return f'{path}.arrow'
+
+
+def newest_load_path(path: str) -> str:
+    """
+    Picks the file to load data from: the checkpoint of a CSV file when it
+    is newer than the CSV, otherwise the file itself. A CSV changed after
+    its checkpoint was saved, e.g. exported again, is parsed once more.
+
+    Args:
+        path (str): CSV or checkpoint path
+
+    Returns:
+        str: Path to be loaded
+    """
+    checkpoint = csv_checkpoint_path(path)
+    if os.path.exists(checkpoint) and os.path.getmtime(checkpoint) >= os.path.getmtime(path):
+        return checkpoint
+    return path
+
+
+def load_file(path: str, bank: str = '') -> pl.DataFrame:
+    """
+    Loads either a native checkpoint, directly, or a CSV file through
+    pre_process_csv.
+
+    Args:
+        path (str): File path
+        bank (str, optional): Bank name, only used by CSV files. Defaults to ''.
+
+    Returns:
+        pl.DataFrame: DataFrame loaded
+    """
+    if detect_checkpoint(path):
+        return load_checkpoint(path)
+    return pre_process_csv(path, bank=bank)
@@ -1,16 +1,23 @@
 # This script should exist in order to pre-process data
 import re
-import os
+import time
 import polars as pl
-import pandas as pd
-import datetime
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
 from schema.finance import FinanceSchema
+from preprocess_lib.categorize import load_rules
+
+
+# Bytes read from the beginning of a file to find out its format
+SNIFF_SIZE = 64 * 1024
+# Data lines, right after the header, checked while sniffing
+SNIFF_ROWS = 20
 
 
 def pre_process_csv(path: str, separation_char:str=';', bank:str='') -> pl.DataFrame:
     """
-    Pre-process CSV files
+    Pre-process CSV files. The format is sniffed once from the beginning of
+    the file, then the file is parsed a single time by a lazy scan, and the
+    rows are categorized by the user rules.
 
     Args:
         path (str): CSV Path do pre-process data;
@@ -20,169 +27,275 @@ def pre_process_csv(path: str, separation_char:str=';', bank:str='') -> pl.DataF
     Returns:
         pl.DataFrame: DataFrame loaded.
     """
-    #Read and try to handle data
-    with open(path, 'r',encoding='utf-8') as f:
-        data = f.read()
-
-    file_name_to_exclude = ''
-    # Remove unused info.
-    if 'Extrato Conta Corrente' in data:
-        _, data = data.split('\n\n')
-        file_name_to_exclude, separation_char = check_integrity_with_finance(data)
-    # Try to load with various formats
-    try:
-        df = pl.read_csv(path,
-                    separator=separation_char,
-                    schema=FinanceSchema(),
-                    decimal_comma=False
-                    )
-    except pl.exceptions.ComputeError:
-        try:
-            df = load_csv_df(path,
-                        separator=separation_char,
-                        schema=FinanceSchema(),
-                        decimal_comma=False)
-            if 'Tipo' in  df.columns:
-                df = df.drop('Tipo')\
-                    .rename({'Lançamento':'Descrição'})\
-                    .with_columns(pl.col('Valor').str.extract(r'([0-9]+,[0-9]+)', 1).str.replace(',', '.').cast(pl.Float64).mul(-1))\
-                    .with_columns(Saldo=pl.lit(0.0).cast(pl.Float64))\
-                    .select('Data', 'Descrição', 'Valor', 'Saldo', 'Categoria')
-        except pl.exceptions.ComputeError:
-            path, separation_char = check_integrity_with_finance(data)
-            df = load_csv_df(path,
-                        separator=separation_char,
-                        schema=FinanceSchema(),
-                        decimal_comma=False)
-    # Delete temporary file, if needed
-    if file_name_to_exclude:
-        os.remove(file_name_to_exclude)
+    csv_format = sniff_csv_format(path, separation_char)
+    match csv_format['layout']:
+        case 'finance':
+            lf = scan_finance_csv(path, csv_format)
+        case 'card':
+            lf = scan_card_csv(path, csv_format)
+        case _:
+            # Needs to be refactored into the FinanceSchema first
+            lf = normalize_to_finance(
+                pl.scan_csv(path,
+                            separator=csv_format['separator'],
+                            skip_rows=csv_format['skip_rows'],
+                            infer_schema_length=0))
     # Filter out data which is not important right now!
-    df = df.with_columns(pl.lit(bank).alias('Banco/Corretora'))
-    return df.filter(pl.col('Descrição') != 'Pagamento efetuado: "Debito Automatico Fatura Cartao Inter"')
+    df = lf.with_columns(pl.lit(bank).alias('Banco/Corretora'))\
+        .filter(pl.col('Descrição') != 'Pagamento efetuado: "Debito Automatico Fatura Cartao Inter"')\
+        .collect(streaming=True)
+    return load_rules().apply(df)
 
 
-def check_integrity_with_finance(data: str) -> Union[str, str]:
+def pre_process_csv_batch(files: list[tuple[str, str]],
+                          separation_char: str = ';',
+                          max_workers: int | None = None,
+                          concat: bool = True) -> tuple[pl.DataFrame | list[pl.DataFrame] | None, dict, dict]:
     """
-    Checks integrity of the file and tries to refactor and set columns according
-    to the current FinanceSchema()
+    Pre-process many CSV files concurrently, e.g. monthly statements from
+    different banks. Polars releases the GIL while parsing, so a thread pool
+    is enough and the frames never need to be copied between processes.
 
     Args:
-        data (str): Data previouly loaded;
-
-    Raises:
-        Exception: Not enough columns to parse
-        Exception: Important columns does not exist
+        files (list[tuple[str, str]]): Pairs of (path, bank);
+        separation_char (str, optional): Separation char to be used on CSV. Defaults to ';'.
+        max_workers (int | None, optional): Threads to be used. Defaults to None,
+            which lets ThreadPoolExecutor decide.
+        concat (bool, optional): Whether to concatenate the files. Defaults to True.
 
     Returns:
-        Union[str, str]: filename and separator char
+        tuple[pl.DataFrame | list[pl.DataFrame] | None, dict, dict]: All files
+        concatenated (None if none could be loaded), or a list with the rows of
+        each file when concat is False, seconds spent on each path and errors by path.
     """
+    def timed_pre_process(path, bank):
+        start = time.perf_counter()
+        df = pre_process_csv(path, separation_char=separation_char, bank=bank)
+        return df, time.perf_counter() - start
 
-    exception_cols = {
-        'Data': 'Deve conter dias no formato YYYY-MM-DD, e.g.: 2000-10-20',
-        'Descrição': 'Deve conter uma descrição da transação',
-        'Valor': 'Deve conter o valor da transação, com 2 casas decimais e sinal de negativo caso seja saída'
-    }
+    frames, timings, errors = [], {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [(path, executor.submit(timed_pre_process, path, bank)) for path, bank in files]
+        for path, future in futures:
+            try:
+                df, timings[path] = future.result()
+                frames.append(df)
+            except Exception as e:
+                errors[path] = e
+    if not concat:
+        return frames, timings, errors
+    if not frames:
+        return None, timings, errors
+    return pl.concat(frames, how='vertical', rechunk=True), timings, errors
+
+
+def sniff_csv_format(path: str, separation_char: str = ';') -> dict:
+    """
+    Finds out the layout of a CSV file, reading only its first SNIFF_SIZE bytes.
+
+    Args:
+        path (str): CSV path;
+        separation_char (str, optional): Preferred separation char. Defaults to ';'.
+
+    Raises:
+        Exception: No separation char found on the header, or no header
+            found after a statement preamble
 
-    header, data = data.split('\n', maxsplit=1)
-    header = header.replace("Data Lançamento", "Data")
-    data = f'{header}\n{data}'
-    print(data)
-    # separation step
-    sep_string = ',;'
-    current_sep = ''
-    for sep in sep_string:
-        col_list = header.split(sep)
-        if len(col_list) > 1:
-            current_sep = sep
+    Returns:
+        dict: layout ('finance', 'card' or 'statement'), separator,
+        skip_rows (lines before the header) and columns
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(SNIFF_SIZE).decode('utf-8', errors='ignore')
+    lines = sample.splitlines()
+    skip_rows = 0
+    layout = 'finance'
+    if 'Extrato Conta Corrente' in sample:
+        # Remove unused info, it ends at the first blank line
+        blank_line = next((idx for idx, line in enumerate(lines) if not line.strip()), None)
+        if blank_line is None:
+            raise Exception('CSV não parseado! Extrato sem linha em branco antes do cabeçalho!')
+        skip_rows = blank_line + 1
+        layout = 'statement'
+    if skip_rows >= len(lines):
+        raise Exception('CSV não parseado! Cabeçalho não encontrado!')
+    header = lines[skip_rows]
+    separator = ''
+    for sep in dict.fromkeys(separation_char + ';,'):
+        if len(header.split(sep)) > 1:
+            separator = sep
             break
-    if not current_sep:
+    if not separator:
         raise Exception('CSV não parseado! Por favor utilize pelo menos "," como separação!')
-    # Start to work on data!
-    filename = handle_tmp_file(data)
-    df = pd.read_csv(filename, sep=current_sep, parse_dates=True, date_format='%Y-%m-%d', encoding='utf-8')
-    for col_name, col_type in FinanceSchema().items():
-        col_type = str(col_type)
-        try:
-            # Add needed columns!
-            if not col_name in df.columns:
-                if col_name == 'Saldo':
-                    df['Saldo'] = 0.0
-                if col_name == 'Categoria':
-                    if 'Histórico' in df.columns:
-                        df['Categoria'] = df['Histórico']
-                    else:
-                        df['Categoria'] = df.apply(lambda x:x['Descrição'].split(':')[0], axis=1)
-                continue
-            # Check Data type and adapt it!
-            if not df[col_name].dtype.name == col_type.lower():
-                if col_type == 'Date':
-                    df[col_name] = pd.to_datetime(arg=df[col_name], yearfirst=True, format='%Y-%m-%d')
-                else:
-                    df[col_name] = df[col_name].astype(col_type.lower())
-        except KeyError:
-            print(df)
-            raise Exception(f'Não há coluna {col_name}'\
-                            f', por favor verifique e adicione a coluna {col_name}'\
-                            f'com a seguinte lógica: {exception_cols[col_name]}!')
-    # reorder data
-    df = df[FinanceSchema().keys()]
-    df.to_csv(filename, sep=current_sep, index=False, header=True)
-    return filename, current_sep
+    columns = [col.strip().strip('"') for col in header.split(separator)]
+    if 'Tipo' in columns:
+        layout = 'card'
+    elif layout == 'finance':
+        rows = [line.split(separator) for line in lines[skip_rows+1:skip_rows+1+SNIFF_ROWS]]
+        if not is_finance_sample(columns, rows):
+            layout = 'statement'
+    return {
+        'layout': layout,
+        'separator': separator,
+        'skip_rows': skip_rows,
+        'columns': columns
+    }
 
 
-def handle_tmp_file(data: str) -> pl.DataFrame:
+def is_finance_sample(columns: list[str], rows: list[list[str]]) -> bool:
     """
-    Handles "Extrato" pattern file.
+    Checks if sampled rows can be read straight into the FinanceSchema,
+    i.e. ISO dates and '.' as decimal separator.
 
     Args:
-        data (str): Data in str form;
+        columns (list[str]): Header columns;
+        rows (list[list[str]]): Sampled data rows, already split.
 
     Returns:
-        pl.DataFrame: DataFrame loaded
+        bool: True when no refactoring is needed
     """
+    if not {'Data', 'Descrição', 'Valor'}.issubset(columns):
+        return False
+    date_idx, value_idx = columns.index('Data'), columns.index('Valor')
+    for row in rows:
+        if len(row) != len(columns):
+            continue
+        if not re.fullmatch(r'[0-9]{4}-[0-9]{2}-[0-9]{2}', row[date_idx].strip().strip('"')):
+            return False
+        if not re.fullmatch(r'-?[0-9]+(\.[0-9]+)?', row[value_idx].strip().strip('"')):
+            return False
+    return True
 
-    file_name = f'csv_files/tmp_{datetime.datetime.now().strftime("%d%m%Y%H%M%S")}.csv'
-    # remove '.' from hundreds
-    data = re.sub(r'(?<=[0-9])\.(?=[0-9]{3})', '', data)
-    # change float to '.' from hundreds
-    data = re.sub(r'(?<=[0-9])\,(?=[0-9]{2})', '.', data)
-    # replace '/' from dates
-    data = re.sub(r'([0-9]{2})/([0-9]{2})/([0-9]{4})', r'\g<3>-\g<2>-\g<1>', data)
-    with open(file_name, 'w', encoding='utf-8') as f:
-        f.write(data)
-    return file_name
 
+def scan_finance_csv(path: str, csv_format: dict) -> pl.LazyFrame:
+    """
+    Lazily scans a CSV already in the FinanceSchema format.
+
+    Args:
+        path (str): CSV path;
+        csv_format (dict): Format found by sniff_csv_format.
+
+    Returns:
+        pl.LazyFrame: Scan with the FinanceSchema columns
+    """
+    schema = FinanceSchema()
+    lf = pl.scan_csv(path,
+                     separator=csv_format['separator'],
+                     skip_rows=csv_format['skip_rows'],
+                     schema_overrides={col: dtype for col, dtype in schema.items()
+                                       if col in csv_format['columns']})
+    if 'Saldo' not in csv_format['columns']:
+        lf = lf.with_columns(Saldo=pl.lit(0.0).cast(pl.Float64))
+    if 'Categoria' not in csv_format['columns']:
+        lf = lf.with_columns(Categoria=pl.lit(None, dtype=pl.String))
+    if 'Banco/Corretora' not in csv_format['columns']:
+        lf = lf.with_columns(pl.lit(None, dtype=pl.String).alias('Banco/Corretora'))
+    return lf.select(schema.keys())
+
+
+def scan_card_csv(path: str, csv_format: dict) -> pl.LazyFrame:
+    """
+    Lazily scans a credit card CSV, which has 'Tipo' and 'Lançamento' columns
+    and amounts such as "R$ 1.234,56". Every amount is an expense.
+
+    Args:
+        path (str): CSV path;
+        csv_format (dict): Format found by sniff_csv_format.
 
-def load_csv_df(path,
-                separator = ',',
-                schema:pl.Schema = None,
-                decimal_comma:bool = False) -> pl.DataFrame:
+    Returns:
+        pl.LazyFrame: Scan with the FinanceSchema columns
     """
-    Loads CSV based on some parameters.
+    return pl.scan_csv(path,
+                       separator=csv_format['separator'],
+                       skip_rows=csv_format['skip_rows'],
+                       infer_schema_length=0)\
+        .drop('Tipo')\
+        .rename({'Lançamento':'Descrição'})\
+        .with_columns(
+            parse_date(pl.col('Data')),
+            pl.col('Valor').str.replace_all(r'[^0-9,\-]', '')\
+                .str.replace(',', '.').cast(pl.Float64).mul(-1),
+            Saldo=pl.lit(0.0).cast(pl.Float64),
+            )\
+        .with_columns(pl.lit(None, dtype=pl.String).alias('Banco/Corretora'))\
+        .select(FinanceSchema().keys())
+
+
+def parse_date(expr: pl.Expr) -> pl.Expr:
+    """
+    Parses dates written either as YYYY-MM-DD or as DD/MM/YYYY.
 
     Args:
-        path (str): Path to load the CSV file
-        separator (str, optional): CSV separator character. Defaults to ','.
-        schema (pl.Schema, optional): Data schema. Defaults to None.
-        decimal_comma (bool, optional): Parse floats using a comma as
-        the decimal separator instead of a period. Defaults to False.
+        expr (pl.Expr): String expression
 
     Returns:
-        pl.DataFrame: DataFrame loaded
+        pl.Expr: Date expression
     """
+    return pl.coalesce(
+        expr.str.to_date('%Y-%m-%d', strict=False),
+        expr.str.to_date('%d/%m/%Y', strict=False))
+
 
-    if schema:
-        return pl.read_csv(path,
-                    separator=separator,
-                    schema=schema,
-                    decimal_comma=decimal_comma
-                    )
-    else:
-        return pl.read_csv(path,
-                    separator=separator,
-                    schema=FinanceSchema(),
-                    decimal_comma=decimal_comma
-                    )
+def parse_amount(expr: pl.Expr) -> pl.Expr:
+    """
+    Parses amounts written in the brazilian format, e.g. 1.234,56, into floats.
+    Amounts already using '.' as decimal separator are kept as they are.
 
+    Args:
+        expr (pl.Expr): String expression
 
+    Returns:
+        pl.Expr: Float expression
+    """
+    # remove '.' from hundreds
+    return expr.str.replace_all(r'\.([0-9]{3})', '$1')\
+        .str.replace(r',([0-9]{2})', '.$1')\
+        .str.strip_chars()\
+        .cast(pl.Float64)
+
+
+def normalize_to_finance(lf: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Refactors a CSV scanned with string columns into the FinanceSchema,
+    with vectorized expressions only.
+
+    Args:
+        lf (pl.LazyFrame): Data loaded with every column as string;
+
+    Raises:
+        Exception: Important columns does not exist
+
+    Returns:
+        pl.LazyFrame: Data with the FinanceSchema columns
+    """
+
+    exception_cols = {
+        'Data': 'Deve conter dias no formato YYYY-MM-DD, e.g.: 2000-10-20',
+        'Descrição': 'Deve conter uma descrição da transação',
+        'Valor': 'Deve conter o valor da transação, com 2 casas decimais e sinal de negativo caso seja saída'
+    }
+
+    columns = lf.collect_schema().names()
+    if 'Data Lançamento' in columns:
+        lf = lf.rename({'Data Lançamento': 'Data'})
+        columns[columns.index('Data Lançamento')] = 'Data'
+    for col_name, logic in exception_cols.items():
+        if col_name not in columns:
+            raise Exception(f'Não há coluna {col_name}'\
+                            f', por favor verifique e adicione a coluna {col_name}'\
+                            f'com a seguinte lógica: {logic}!')
+    # Add needed columns!
+    if 'Categoria' not in columns:
+        if 'Histórico' in columns:
+            lf = lf.with_columns(Categoria=pl.col('Histórico'))
+        else:
+            lf = lf.with_columns(Categoria=pl.col('Descrição').str.split(':').list.first())
+    lf = lf.with_columns(
+        parse_date(pl.col('Data')),
+        parse_amount(pl.col('Valor')),
+        parse_amount(pl.col('Saldo')) if 'Saldo' in columns else pl.lit(0.0).alias('Saldo'),
+        pl.col('Banco/Corretora') if 'Banco/Corretora' in columns
+            else pl.lit('').alias('Banco/Corretora')
+        )
+    # reorder data
+    return lf.select(FinanceSchema().keys())
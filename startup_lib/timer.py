@@ -0,0 +1,65 @@
+import json
+import time
+
+
+class StartupTimer():
+    def __init__(self) -> None:
+        """
+        Wall clock of the startup phases, imports included, so create it
+        before importing anything heavy. Phases are marked as they end,
+        some of them by background stages, so each one is kept as the time
+        since the start, along with the time since the previous mark.
+        """
+        self.start = time.perf_counter()
+        self._last = self.start
+        # (phase, seconds since the start, seconds since the previous mark)
+        self.phases = []
+
+
+    def mark(self, phase: str) -> float:
+        """
+        Marks the end of a phase.
+
+        Args:
+            phase (str): Phase name
+
+        Returns:
+            float: Seconds since the start
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.start, now - self._last))
+        self._last = now
+        return now - self.start
+
+
+    def report(self, title: str) -> str:
+        """
+        Formats the phases marked so far.
+
+        Args:
+            title (str): First line of the report
+
+        Returns:
+            str: One line per phase
+        """
+        width = max([len(phase) for phase, _, _ in self.phases], default=0)
+        lines = [title]
+        for phase, at, took in self.phases:
+            lines.append(f'  {phase:<{width}}  {at*1000:8.1f} ms  (+{took*1000:.1f} ms)')
+        return '\n'.join(lines)
+
+
+    def save(self, path: str) -> None:
+        """
+        Appends the phases to a JSON lines file, one line per launch, so
+        startups can be compared over time.
+
+        Args:
+            path (str): JSON lines file path
+        """
+        record = {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'phases': {phase: round(at, 4) for phase, at, _ in self.phases}
+        }
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
@@ -0,0 +1,54 @@
+import polars as pl
+import pytest
+from preprocess_lib.categorize import CategoryRules
+
+RULES = [
+    {'match': 'keyword', 'pattern': 'uber', 'category': 'Transporte'},
+    {'match': 'prefix', 'pattern': 'Pix', 'category': 'Pix'},
+    {'match': 'regex', 'pattern': '^(IFOOD|RAPPI)', 'category': 'Alimentação'},
+    {'match': 'keyword', 'pattern': 'mercado', 'category': 'Supermercado'},
+    {'match': 'keyword', 'pattern': 'R$ 1.0', 'category': 'Literal'},
+]
+
+
+@pytest.mark.parametrize('description, category', [
+    ('Pix enviado Uber', 'Transporte'),     # an earlier rule wins, even matching later in the text
+    ('Pix enviado Mercado', 'Pix'),
+    ('pix recebido', 'Pix'),                # matching ignores case
+    ('Compra Pix', None),                   # prefix rules only match the start
+    ('IFOOD *RESTAURANTE', 'Alimentação'),
+    ('Compra IFOOD', None),
+    ('SUPERMERCADO X', 'Supermercado'),
+    ('Tarifa R$ 1.00', 'Literal'),          # keywords are literal text
+    ('Tarifa R$ 1X00', None),
+    ('Linha 1\nuber', 'Transporte'),
+    ('Nada', None),
+])
+def test_first_matching_rule_wins(description, category):
+    assert CategoryRules(RULES).categorize(pl.Series([description])).to_list() == [category]
+
+
+def test_memoized_results_match_the_first_run():
+    rules = CategoryRules(RULES)
+    descriptions = pl.Series(['Pix A', 'Uber', None, 'Pix A', 'Nada'])
+
+    assert rules.categorize(descriptions).to_list() == ['Pix', 'Transporte', None, 'Pix', None]
+    assert rules.categorize(descriptions).to_list() == ['Pix', 'Transporte', None, 'Pix', None]
+
+
+def test_unmatched_rows_keep_their_category():
+    df = pl.DataFrame({'Descrição': ['Uber', 'Nada'], 'Categoria': ['Velha', 'Velha']})
+
+    assert CategoryRules(RULES).apply(df).get_column('Categoria').to_list() == ['Transporte', 'Velha']
+
+
+@pytest.mark.parametrize('rules', [
+    [{'match': 'regex', 'pattern': '(?<=PIX )MERCADO', 'category': 'X'}],    # no look-arounds in polars
+    [{'match': 'regex', 'pattern': '(a)\\1', 'category': 'X'}],
+    [{'match': 'regex', 'pattern': '(?P<x>a)', 'category': 'X'}, {'match': 'regex', 'pattern': '(?P<x>b)', 'category': 'Y'}],
+    [{'match': 'contains', 'pattern': 'a', 'category': 'X'}],
+    [{'match': 'keyword', 'pattern': '', 'category': 'X'}],
+])
+def test_invalid_rules_are_rejected(rules):
+    with pytest.raises(Exception, match='inválida'):
+        CategoryRules(rules)
@@ -0,0 +1,91 @@
+import datetime
+import pytest
+from preprocess_lib.csv import pre_process_csv, pre_process_csv_batch, sniff_csv_format
+from schema.finance import FinanceSchema
+
+FINANCE_CSV = (
+    'Data;Descrição;Valor;Saldo;Categoria;Banco/Corretora\n'
+    '2024-01-02;Pix enviado: Fulano;-150.5;849.5;Pix;Inter\n'
+    '2024-01-03;Salário: Empresa;5000.0;5849.5;Salário;Inter\n'
+)
+STATEMENT_CSV = (
+    'Extrato Conta Corrente \n'
+    'Conta ;12345\n'
+    'Período ;02/01/2024 a 03/01/2024\n'
+    'Saldo ;1.000,00\n'
+    '\n'
+    'Data Lançamento;Histórico;Descrição;Valor;Saldo\n'
+    '02/01/2024;Pix enviado ;Fulano;-1.150,50;-150,50\n'
+    '03/01/2024;Salário ;Empresa;5.000,00;4.849,50\n'
+)
+CARD_CSV = (
+    '"Data","Lançamento","Categoria","Tipo","Valor"\n'
+    '"02/01/2024","MERCADO BOM PRECO","Supermercado","Compra à vista","R$ 1.234,56"\n'
+    '"03/01/2024","UBER *TRIP","Transporte","Parcela 1/3","-R$ 20,00"\n'
+)
+# FinanceSchema columns, but brazilian dates and amounts
+BRAZILIAN_FINANCE_CSV = (
+    'Data;Descrição;Valor;Saldo\n'
+    '02/01/2024;Pix enviado: Fulano;-1.150,50;-150,50\n'
+    '03/01/2024;Salário: Empresa;5.000,00;4.849,50\n'
+)
+
+
+@pytest.fixture
+def write_csv(tmp_path, monkeypatch):
+    # Category rules are read from the working directory
+    monkeypatch.chdir(tmp_path)
+    def write(name, content):
+        path = tmp_path / name
+        path.write_text(content, encoding='utf-8')
+        return str(path)
+    return write
+
+
+@pytest.mark.parametrize('content, layout, separator, skip_rows', [
+    (FINANCE_CSV, 'finance', ';', 0),
+    (STATEMENT_CSV, 'statement', ';', 5),
+    (CARD_CSV, 'card', ',', 0),
+    (BRAZILIAN_FINANCE_CSV, 'statement', ';', 0),
+])
+def test_sniff_finds_the_layout(write_csv, content, layout, separator, skip_rows):
+    csv_format = sniff_csv_format(write_csv('extrato.csv', content))
+
+    assert (csv_format['layout'], csv_format['separator'], csv_format['skip_rows']) == (layout, separator, skip_rows)
+
+
+@pytest.mark.parametrize('content', [
+    'Extrato Conta Corrente\nConta ;1\n',       # preamble never ends
+    'Extrato Conta Corrente\nConta ;1\n\n',     # nothing after the preamble
+    'Data|Descrição|Valor\n2024-01-02|x|1.0\n', # unknown separator
+])
+def test_sniff_rejects_unparseable_files(write_csv, content):
+    with pytest.raises(Exception, match='CSV não parseado'):
+        sniff_csv_format(write_csv('extrato.csv', content))
+
+
+@pytest.mark.parametrize('content, descriptions, amounts, categories', [
+    (FINANCE_CSV, ['Pix enviado: Fulano', 'Salário: Empresa'], [-150.5, 5000.0], ['Pix', 'Salário']),
+    (STATEMENT_CSV, ['Fulano', 'Empresa'], [-1150.5, 5000.0], ['Pix enviado ', 'Salário ']),
+    (CARD_CSV, ['MERCADO BOM PRECO', 'UBER *TRIP'], [-1234.56, 20.0], ['Supermercado', 'Transporte']),
+    (BRAZILIAN_FINANCE_CSV, ['Pix enviado: Fulano', 'Salário: Empresa'], [-1150.5, 5000.0], ['Pix enviado', 'Salário']),
+])
+def test_every_layout_is_read_into_the_finance_schema(write_csv, content, descriptions, amounts, categories):
+    df = pre_process_csv(write_csv('extrato.csv', content), bank='Nubank')
+
+    assert df.schema == FinanceSchema()
+    assert df.get_column('Data').to_list() == [datetime.date(2024, 1, 2), datetime.date(2024, 1, 3)]
+    assert df.get_column('Descrição').to_list() == descriptions
+    assert df.get_column('Valor').to_list() == amounts
+    assert df.get_column('Categoria').to_list() == categories
+    assert df.get_column('Banco/Corretora').to_list() == ['Nubank', 'Nubank']
+
+
+def test_batch_keeps_going_past_broken_files(write_csv):
+    good, broken = write_csv('bom.csv', FINANCE_CSV), write_csv('ruim.csv', 'Extrato Conta Corrente\n')
+
+    frames, timings, errors = pre_process_csv_batch([(good, 'Inter'), (broken, 'Inter')], concat=False)
+
+    assert [df.height for df in frames] == [2]
+    assert list(timings) == [good]
+    assert list(errors) == [broken]
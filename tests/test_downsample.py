@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from chart_lib.downsample import lttb, points_for_width, MIN_POINTS
+
+
+@pytest.mark.parametrize('threshold', [3, 10, 100, 999])
+def test_lttb_keeps_the_endpoints_within_budget(threshold):
+    rng = np.random.default_rng(0)
+    x = np.arange(1000)
+    y = rng.normal(size=1000).cumsum()
+
+    kept = lttb(x, y, threshold)
+
+    assert len(kept) == threshold
+    assert kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_peaks():
+    y = np.zeros(1000)
+    y[437], y[812] = 100, -100
+
+    kept = lttb(np.arange(1000), y, 50)
+
+    assert 437 in kept and 812 in kept
+
+
+def test_lttb_reads_dates():
+    x = np.arange('2024-01-01', '2026-01-01', dtype='datetime64[D]')
+
+    assert len(lttb(x, np.sin(np.arange(len(x))), 100)) == 100
+
+
+@pytest.mark.parametrize('threshold', [2, 1000, 5000])
+def test_lttb_keeps_everything_when_it_cannot_help(threshold):
+    assert np.array_equal(lttb(np.arange(1000), np.arange(1000), threshold), np.arange(1000))
+
+
+def test_point_budget_follows_the_width():
+    assert points_for_width(1920) == 480
+    assert points_for_width(100) == MIN_POINTS
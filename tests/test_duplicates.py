@@ -0,0 +1,56 @@
+import datetime
+import polars as pl
+from models.duplicates import DuplicateIndex
+from schema.finance import FinanceSchema
+
+
+def rows(*transactions):
+    return pl.DataFrame({
+        'Data': [datetime.date(2024, 1, day) for day, _, _ in transactions],
+        'Descrição': [description for _, description, _ in transactions],
+        'Valor': [amount for _, _, amount in transactions],
+        'Saldo': [0.0] * len(transactions),
+        'Categoria': ['Compra'] * len(transactions),
+        'Banco/Corretora': ['Banco'] * len(transactions)
+    }, schema=FinanceSchema())
+
+
+def test_a_transaction_n_times_in_the_statement_and_k_in_the_ledger_is_kept_n_minus_k_times():
+    ledger = rows((1, 'Café', -5.0), (1, 'Café', -5.0), (2, 'Uber', -20.0))
+    statement = rows((1, 'Café', -5.0), (1, 'Café', -5.0), (1, 'Café', -5.0), (2, 'Uber', -20.0), (3, 'Pix', 10.0))
+
+    kept = DuplicateIndex().new_rows(statement, ledger)
+
+    assert kept.select('Data', 'Descrição', 'Valor').rows() == [
+        (datetime.date(2024, 1, 1), 'Café', -5.0), (datetime.date(2024, 1, 3), 'Pix', 10.0)]
+
+
+def test_statements_imported_together_are_checked_against_each_other():
+    index = DuplicateIndex()
+    accepted = {}
+    first = rows((1, 'Café', -5.0), (2, 'Uber', -20.0))
+    overlapping = rows((2, 'Uber', -20.0), (3, 'Pix', 10.0))
+
+    assert index.new_rows(first, rows(), accepted).height == 2
+    assert index.new_rows(overlapping, rows(), accepted).height == 1
+
+
+def test_counts_follow_the_ledger():
+    ledger = rows((1, 'Café', -5.0))
+    index = DuplicateIndex()
+    index.new_rows(rows(), ledger)
+    index.add(rows((2, 'Uber', -20.0)))
+    index.remove(ledger)
+
+    statement = rows((1, 'Café', -5.0), (2, 'Uber', -20.0))
+    assert index.new_rows(statement, ledger).select('Descrição').to_series().to_list() == ['Café']
+
+
+def test_building_twice_keeps_the_counts():
+    ledger = rows((1, 'Café', -5.0))
+    index = DuplicateIndex()
+    index.build(ledger)
+    index.add(rows((1, 'Café', -5.0)))
+    index.build(ledger)
+
+    assert index.new_rows(rows((1, 'Café', -5.0), (1, 'Café', -5.0), (1, 'Café', -5.0)), ledger).height == 1
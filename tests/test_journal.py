@@ -0,0 +1,149 @@
+import datetime
+import os
+import pathlib
+import polars as pl
+import pytest
+from models.journal import ChangeJournal
+from models.ledger import Ledger
+from preprocess_lib.checkpoint import csv_checkpoint_path, newest_load_path, save_checkpoint
+from schema.finance import FinanceSchema
+
+
+def crash_while_appending(path, partial=b'{"op":"set","row":0,"col'):
+    # What is left on the disk when the process dies in the middle of a write
+    with open(path, 'ab') as f:
+        f.write(partial)
+
+
+def rows(count, day):
+    return pl.DataFrame({
+        'Data': [datetime.date(2024, 1, day)] * count,
+        'Descrição': [f'Compra {day}-{idx}' for idx in range(count)],
+        'Valor': [-10.0 * (idx + 1) for idx in range(count)],
+        'Saldo': [0.0] * count,
+        'Categoria': ['Compra'] * count,
+        'Banco/Corretora': ['Banco'] * count
+    }, schema=FinanceSchema())
+
+
+@pytest.fixture
+def base(tmp_path):
+    path = tmp_path / 'base.arrow'
+    path.write_bytes(b'base')
+    return str(path)
+
+
+def test_records_appended_after_a_crash_are_replayed(base):
+    path = f'{base}.journal'
+    journal = ChangeJournal(path, base)
+    journal.append('remove', rows=[0])
+    journal.append('remove', rows=[1])
+    crash_while_appending(path)
+
+    # Next session: replays what survived, then keeps on recording
+    journal = ChangeJournal(path, base)
+    assert len(list(journal.replay())) == 2
+    journal.append('remove', rows=[2])
+
+    assert [record['rows'] for record in ChangeJournal(path, base).replay()] == [[0], [1], [2]]
+
+
+def test_complete_record_missing_its_newline_is_kept(base):
+    path = f'{base}.journal'
+    ChangeJournal(path, base).append('remove', rows=[0])
+    crash_while_appending(path, b'{"op":"remove","rows":[1]}')
+
+    journal = ChangeJournal(path, base)
+    assert len(list(journal.replay())) == 2
+    journal.append('remove', rows=[2])
+
+    assert [record['rows'] for record in ChangeJournal(path, base).replay()] == [[0], [1], [2]]
+
+
+def test_invalid_lines_are_skipped(base):
+    path = f'{base}.journal'
+    ChangeJournal(path, base).append('remove', rows=[0])
+    crash_while_appending(path, b'lixo\n{"op":"remove","rows":[1]}\n')
+
+    assert [record['rows'] for record in ChangeJournal(path, base).replay()] == [[0], [1]]
+
+
+@pytest.mark.parametrize('replace_base', [
+    lambda path: pathlib.Path(path).write_bytes(b'outra base'),  # rewritten by another program
+    lambda path: os.utime(path, ns=(0, 0)),                     # same size, another file
+    lambda path: os.remove(path),
+])
+def test_journal_of_another_base_is_set_aside(base, replace_base):
+    path = f'{base}.journal'
+    ChangeJournal(path, base).append('remove', rows=[0])
+    replace_base(base)
+
+    assert list(ChangeJournal(path, base).replay()) == []
+    assert not os.path.exists(path)
+    assert os.path.exists(f'{path}.orphan')
+
+
+def test_journal_without_a_base_record_is_set_aside(base):
+    path = f'{base}.journal'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"op":"remove","rows":[0]}\n')
+
+    assert list(ChangeJournal(path, base).replay()) == []
+    assert os.path.exists(f'{path}.orphan')
+
+
+def test_ledger_rebuilt_after_a_crash_matches_the_live_one(tmp_path, monkeypatch):
+    # Category rules are read from the working directory
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'base.arrow')
+    save_checkpoint(rows(5, 10), path)
+
+    ledger = Ledger(path, 'Banco')
+    ledger.add_rows(rows(3, 5))
+    ledger.set_value(0, 2, '-99.5')
+    crash_while_appending(f'{path}.journal')
+
+    ledger = Ledger(path, 'Banco')
+    ledger.add_rows(rows(2, 20))
+    ledger.remove_rows([1])
+    ledger.set_value(2, 1, 'Editado depois do crash')
+
+    assert Ledger(path, 'Banco').data.equals(ledger.data)
+
+
+def test_ledger_ignores_the_journal_of_a_replaced_base(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'base.arrow')
+    save_checkpoint(rows(5, 10), path)
+    Ledger(path, 'Banco').remove_rows([0, 1])
+
+    save_checkpoint(rows(4, 11), path)
+
+    assert Ledger(path, 'Banco').data.height == 4
+
+
+def test_changes_are_carried_over_to_the_checkpoint_of_a_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'extrato.csv')
+    save_checkpoint(rows(5, 10), path)
+    ledger = Ledger(path, 'Banco')
+    ledger.add_rows(rows(3, 5))
+    ledger = Ledger(path, 'Banco')
+    ledger.set_value(0, 2, '-99.5')
+
+    assert ledger.checkpoint_base(csv_checkpoint_path(path))
+    ledger.remove_rows([1])
+
+    assert newest_load_path(path) == csv_checkpoint_path(path)
+    assert not os.path.exists(f'{path}.journal')
+    assert Ledger(csv_checkpoint_path(path), 'Banco').data.equals(ledger.data)
+
+
+def test_csv_changed_after_its_checkpoint_is_parsed_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'extrato.csv')
+    save_checkpoint(rows(5, 10), path)
+    Ledger(path, 'Banco').checkpoint_base(csv_checkpoint_path(path))
+    os.utime(csv_checkpoint_path(path), ns=(0, 0))
+
+    assert newest_load_path(path) == path
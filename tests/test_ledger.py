@@ -0,0 +1,175 @@
+import datetime
+import random
+import polars as pl
+import pytest
+from models.ledger import Ledger, LedgerListener, LEDGER_SORT_KEY
+from models.search import SearchIndex
+from preprocess_lib.categorize import CategoryRules
+from preprocess_lib.checkpoint import save_checkpoint
+from schema.finance import FinanceSchema
+
+
+def statement(count, seed, first_day=datetime.date(2024, 1, 1), days=30):
+    rng = random.Random(seed)
+    return pl.DataFrame({
+        'Data': [first_day + datetime.timedelta(days=rng.randrange(days)) for _ in range(count)],
+        'Descrição': [rng.choice(['Pix enviado', 'Mercado', 'Salário', 'Uber']) for _ in range(count)],
+        'Valor': [round(rng.uniform(-500, 500), 2) for _ in range(count)],
+        'Saldo': [0.0] * count,
+        'Categoria': [rng.choice(['Pix', 'Compra', 'Transporte']) for _ in range(count)],
+        'Banco/Corretora': ['Banco'] * count
+    }, schema=FinanceSchema())
+
+
+def recalculated(data):
+    # What a full recalculation makes of the ledger
+    return data.sort(*LEDGER_SORT_KEY).with_columns(pl.col('Valor').cum_sum().alias('Saldo'))
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    # Category rules are read from the working directory
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / 'base.arrow')
+    save_checkpoint(recalculated(statement(200, seed=1)), path)
+    ledger = Ledger(path, 'Banco')
+    ledger.detach_journal()
+    return ledger
+
+
+def assert_consistent(ledger):
+    assert ledger.data.equals(recalculated(ledger.data))
+
+
+@pytest.mark.parametrize('column, value', [
+    (2, '-12.34'),          # Valor, moves the row and changes every later Saldo
+    (0, '2024-03-01'),      # Data, moves the row to the end
+    (1, 'Aaa primeiro'),    # Descrição, moves the row within its day
+    (4, 'Outra'),           # Categoria
+])
+def test_set_value_matches_a_full_recalculation(ledger, column, value):
+    ledger.set_value(5, column, value)
+
+    assert_consistent(ledger)
+
+
+def test_random_edits_match_a_full_recalculation(ledger):
+    rng = random.Random(7)
+    for seed in range(40):
+        match rng.randrange(3):
+            case 0:
+                ledger.set_value(rng.randrange(ledger.data.height), rng.choice([0, 1, 2, 4]),
+                                 rng.choice(['2024-01-15', 'Mercado', '42.5', 'Pix']))
+            case 1:
+                ledger.add_rows(statement(rng.choice([1, 5, 40]), seed), skip_duplicates=False)
+            case 2:
+                ledger.add_rows(statement(3, seed, first_day=datetime.date(2025, 1, 1)), skip_duplicates=False)
+        assert_consistent(ledger)
+
+
+def test_display_values_follow_edits(ledger):
+    for column in ledger.cached_display_columns():
+        ledger.display_column(column)
+    ledger.set_value(3, 2, '1000.5')
+    ledger.set_value(10, 1, 'Editado')
+    ledger.add_rows(statement(4, seed=3), skip_duplicates=False)
+
+    for column in range(ledger.data.width):
+        expected = [f'{value:.2f}' if isinstance(value, float) else str(value)
+                    for value in ledger.data.to_series(column).to_list()]
+        assert [ledger.display_value(row, column) for row in range(ledger.data.height)] == expected
+
+
+def test_widest_values_follow_edits(ledger):
+    saldo = ledger.data.get_column_index('Saldo')
+    for column in range(ledger.data.width):
+        ledger.widest_values(column)
+    ledger.set_value(0, 2, '-98765432.1')
+    ledger.add_rows(statement(4, seed=5), skip_duplicates=False)
+
+    for column in range(ledger.data.width):
+        widest = max(len(ledger.display_value(row, column)) for row in range(ledger.data.height))
+        assert len(ledger.widest_values(column)[0]) >= widest
+    assert len(ledger.widest_values(saldo)[0]) == len('-98765432.10')
+
+
+@pytest.mark.parametrize('rows', [
+    [0],
+    [5, 6, 7, 50, 199],
+    list(range(0, 200, 3)),     # more ranges than announced one by one
+])
+def test_remove_rows_matches_a_full_recalculation(ledger, rows):
+    expected = ledger.data.with_row_index().filter(~pl.col('index').is_in(rows)).drop('index')
+
+    ledger.remove_rows(rows)
+
+    assert ledger.data.drop('Saldo').equals(expected.drop('Saldo'))
+    assert_consistent(ledger)
+
+
+class MirrorListener(LedgerListener):
+    """
+    Keeps a copy of the ledger up to date from the notifications alone,
+    the way a view does.
+    """
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.rows = [list(row) for row in ledger.data.rows()]
+        self.pending = None
+
+    def rows_inserting(self, first, last):
+        self.pending = (first, last)
+
+    def rows_inserted(self):
+        first, last = self.pending
+        self.rows[first:first] = [list(row) for row in self.ledger.data.slice(first, last-first+1).rows()]
+
+    def rows_removing(self, first, last):
+        del self.rows[first:last+1]
+
+    def row_moving(self, row, destination):
+        self.pending = (row, destination)
+
+    def row_moved(self):
+        row, destination = self.pending
+        moved = self.rows.pop(row)
+        self.rows.insert(destination-1 if destination > row else destination, moved)
+
+    def cells_changed(self, first, last, column):
+        for row, value in enumerate(self.ledger.data.to_series(column).slice(first, last-first+1), first):
+            self.rows[row][column] = value
+
+    def reset(self):
+        self.rows = [list(row) for row in self.ledger.data.rows()]
+
+    def end_change(self):
+        assert self.rows == [list(row) for row in self.ledger.data.rows()]
+
+
+def test_notifications_describe_every_change(ledger):
+    ledger.listener = MirrorListener(ledger)
+    rng = random.Random(3)
+    for seed in range(30):
+        match rng.randrange(4):
+            case 0:
+                ledger.set_value(rng.randrange(ledger.data.height), rng.choice([0, 1, 2, 4]),
+                                 rng.choice(['2024-01-15', 'Mercado', '42.5', 'Pix']))
+            case 1:
+                ledger.remove_rows(rng.sample(range(ledger.data.height), rng.choice([1, 3, 40])))
+            case 2:
+                ledger.add_rows(statement(rng.choice([1, 5, 40]), seed), skip_duplicates=False)
+            case 3:
+                ledger.add_registry({'date': datetime.date(2024, 1, 10), 'desc': 'Manual',
+                                     'operation': 'Saída', 'amount': 12.5})
+
+
+def test_search_index_follows_edits(ledger):
+    ledger.search_index.build(ledger.data)
+    ledger.set_value(3, 1, 'Padaria Pão de Açúcar')
+    ledger.add_rows(statement(10, seed=4), skip_duplicates=False)
+    ledger.remove_rows(range(0, 30))
+    ledger.recategorize(CategoryRules([{'match': 'keyword', 'pattern': 'uber', 'category': 'Táxi'}]))
+
+    fresh = SearchIndex()
+    for query in ['pix', 'padaria acucar', 'taxi', 'transporte', 'uber', 'sal']:
+        assert ledger.search_index.search(query, ledger.data) == fresh.search(query, ledger.data)
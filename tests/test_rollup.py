@@ -0,0 +1,52 @@
+import datetime
+import random
+import polars as pl
+import pytest
+from models.rollup import PeriodRollup, PERIODS, ROLLUP_KEY
+from schema.finance import FinanceSchema
+
+
+def transactions(count, seed):
+    rng = random.Random(seed)
+    return pl.DataFrame({
+        'Data': [rng.choice([None] + [datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(400))] * 20)
+                 for _ in range(count)],
+        'Descrição': [rng.choice(['Pix', 'Mercado', 'Uber']) for _ in range(count)],
+        'Valor': [round(rng.uniform(-100, 100), 2) for _ in range(count)],
+        'Saldo': [0.0] * count,
+        'Categoria': [rng.choice(['Pix', 'Compra', None]) for _ in range(count)],
+        'Banco/Corretora': ['Banco'] * count
+    }, schema=FinanceSchema())
+
+
+def canonical(table):
+    return table.sort(ROLLUP_KEY, nulls_last=True).with_columns(pl.col('Valor').round(6))
+
+
+@pytest.mark.parametrize('every', PERIODS)
+def test_folded_changes_match_a_direct_aggregation(every):
+    rng = random.Random(every)
+    data = transactions(500, seed=0)
+    rollup = PeriodRollup()
+    rollup.table(every, data)
+    for seed in range(1, 20):
+        if rng.random() < 0.5:
+            removed = rng.sample(range(data.height), rng.choice([1, 20]))
+            rollup.remove(data[removed])
+            data = data.with_row_index().filter(~pl.col('index').is_in(removed)).drop('index')
+        else:
+            added = transactions(rng.choice([1, 30]), seed)
+            rollup.add(added)
+            data = pl.concat([data, added])
+        if rng.random() < 0.5:
+            assert canonical(rollup.table(every, data)).equals(canonical(rollup.aggregate(data, every)))
+    assert canonical(rollup.table(every, data)).equals(canonical(rollup.aggregate(data, every)))
+
+
+def test_emptied_buckets_are_dropped():
+    data = transactions(50, seed=2)
+    rollup = PeriodRollup()
+    rollup.table('1mo', data)
+    rollup.remove(data)
+
+    assert rollup.table('1mo', data.clear()).is_empty()